@@ -0,0 +1,81 @@
+"""Память на брошенные черновики: словарь user_data против Draft и очистка.
+
+Запуск: python benchmarks/bench_drafts.py [количество сессий]
+"""
+
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+SESSIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+
+def make_dict_session(user_id):
+    # Так черновик хранился до Draft
+    return {
+        'photo_id': f"AgACAgIAAxkBAAI{user_id:020d}",
+        'age': 25,
+        'country': 'Russia',
+        'country_emoji': '🇷🇺',
+        'is_anonymous': True,
+        'display_username': 'Anon',
+    }
+
+
+def make_draft_session(user_id):
+    draft = bot.Draft()
+    draft.photo_id = f"AgACAgIAAxkBAAI{user_id:020d}"
+    draft.age = 25
+    draft.country = 'Russia'
+    draft.country_emoji = '🇷🇺'
+    draft.display_username = 'Anon'
+    return draft
+
+
+def measure(factory):
+    gc.collect()
+    tracemalloc.start()
+    sessions = {user_id: factory(user_id) for user_id in range(SESSIONS)}
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return sessions, size
+
+
+class FakeApplication:
+    def __init__(self, user_data):
+        self.user_data = user_data
+
+    def drop_user_data(self, user_id):
+        del self.user_data[user_id]
+
+
+def main():
+    sessions, dict_size = measure(make_dict_session)
+    del sessions
+
+    sessions, draft_size = measure(make_draft_session)
+    stale_time = time.monotonic() - bot.CONVERSATION_TIMEOUT - 1
+    for draft in sessions.values():
+        draft.updated_at = stale_time
+
+    application = FakeApplication(sessions)
+    started = time.perf_counter()
+    asyncio.run(bot.cleanup_drafts_job(SimpleNamespace(application=application)))
+    cleanup_time = time.perf_counter() - started
+
+    print(f"sessions:             {SESSIONS}")
+    print(f"dict user_data:       {dict_size / 2 ** 20:8.1f} MiB ({dict_size / SESSIONS:.0f} B/session)")
+    print(f"Draft user_data:      {draft_size / 2 ** 20:8.1f} MiB ({draft_size / SESSIONS:.0f} B/session)")
+    print(f"after cleanup:        {len(application.user_data)} sessions left, took {cleanup_time:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
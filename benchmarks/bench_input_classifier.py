@@ -0,0 +1,41 @@
+"""Пропускная способность разбора ввода: возраст, анонимность, username и страна.
+
+Запуск: python benchmarks/bench_input_classifier.py [количество итераций]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+CASES = {
+    'age': (bot.input_classifier.classify_age, ['25', ' 101 ', 'abc', '²⁵']),
+    'anon': (lambda user_input: bot.input_classifier.classify_anon(user_input, 'ru'),
+             ['анон', 'не анон', 'Not Anonymous', 'canon']),
+    'username': (bot.input_classifier.classify_username, ['@John_Smith', '@john', '@' + 'a' * 33, 'username']),
+    'country': (bot.input_classifier.classify_country, ['RU', 'Russia', '🇩🇪', 'герман', 'atlantis']),
+}
+
+
+def measure(classify, texts):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for text in texts:
+            classify(bot.UserInput(text))
+    elapsed = time.perf_counter() - started
+    return ITERATIONS * len(texts) / elapsed
+
+
+def main():
+    print(f"iterations:           {ITERATIONS}")
+    for name, (classify, texts) in CASES.items():
+        print(f"{name + ':':<22}{measure(classify, texts):12,.0f} inputs/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Время запросов /search на базе с миллионами постов.
+
+Запуск: python benchmarks/bench_search.py [количество постов] [файл базы]
+Если файл базы уже существует, он используется повторно без заполнения.
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+POSTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+DB_PATH = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), f"bench_search_{POSTS}.db")
+POSTS_PER_USER = 4
+REPEATS = 20
+
+FIRST_NAMES = [
+    'ivan', 'anna', 'maria', 'alexander', 'alexey', 'dmitry', 'elena', 'olga', 'sergey', 'natalia',
+    'john', 'mary', 'michael', 'sarah', 'david', 'emma', 'james', 'olivia', 'robert', 'sophia',
+]
+COUNTRIES = ['Russia', 'United States', 'Germany', 'France', 'Ukraine', 'Poland', 'Spain', 'Italy', 'Brazil', 'India']
+
+QUERIES = {
+    'user id': lambda: str(random.randrange(1, POSTS // POSTS_PER_USER)),
+    'common word': lambda: random.choice(FIRST_NAMES).title(),
+    'common country': lambda: random.choice(COUNTRIES),
+    'rare word': lambda: f"surname{random.randrange(100_000)}",
+    'two words': lambda: f"{random.choice(FIRST_NAMES)} surname{random.randrange(100_000)}",
+    'common prefix': lambda: random.choice(FIRST_NAMES)[:4],
+    'short prefix': lambda: random.choice(FIRST_NAMES)[:3],
+    'rare prefix': lambda: f"surname{random.randrange(100_000)}"[:10],
+    'username prefix': lambda: f"user{random.randrange(1, 1000)}",
+    # Начало тысяч разных слов: такой поиск прерывается по SEARCH_PREFIX_TIMEOUT
+    'long prefix': lambda: random.choice(['surnam', 'surname', 'userx']),
+    'anon': lambda: 'anon',
+}
+
+
+def fill(db):
+    rng = random.Random(42)
+    users = POSTS // POSTS_PER_USER
+    now = datetime.now()
+    with db.transaction():
+        db.conn.executemany(
+            'INSERT INTO users (user_id, username, full_name, reg_date) VALUES (?, ?, ?, ?)',
+            (
+                (user_id, f"user{user_id}", f"{rng.choice(FIRST_NAMES).title()} Surname{rng.randrange(100_000)}", now)
+                for user_id in range(1, users + 1)
+            )
+        )
+        db.conn.executemany(
+            '''
+            INSERT INTO posts (user_id, photo_id, age, country, country_emoji, is_anonymous, display_username, created_at)
+            VALUES (?, 'photo', 25, ?, '', ?, ?, ?)
+            ''',
+            (
+                (user_id, rng.choice(COUNTRIES), anonymous, 'Anon' if anonymous else f"@user{user_id}", now)
+                for user_id, anonymous in ((rng.randrange(1, users + 1), rng.random() < 0.5) for _ in range(POSTS))
+            )
+        )
+
+
+def measure(db, make_query):
+    first_page, next_page = [], []
+    for _ in range(REPEATS):
+        query = make_query()
+        started = time.perf_counter()
+        posts = db.search_posts(query)
+        first_page.append(time.perf_counter() - started)
+
+        if posts:
+            started = time.perf_counter()
+            db.search_posts(query, posts[-1]['post_id'])
+            next_page.append(time.perf_counter() - started)
+
+    return first_page, next_page
+
+
+def format_ms(samples):
+    if not samples:
+        return '       -        -'
+    return f"{statistics.median(samples) * 1000:8.2f} {max(samples) * 1000:8.2f}"
+
+
+def main():
+    random.seed(1)
+    exists = os.path.exists(DB_PATH)
+    db = bot.Database(DB_PATH)
+    if not exists:
+        started = time.perf_counter()
+        fill(db)
+        print(f"filled {POSTS} posts in {time.perf_counter() - started:.0f} s")
+
+    print(f"posts: {POSTS}, database: {DB_PATH}")
+    print(f"{'query':<18}{'median ms':>9}{'max ms':>9} {'next page ms':>17}")
+    for name, make_query in QUERIES.items():
+        first_page, next_page = measure(db, make_query)
+        print(f"{name:<18}{format_ms(first_page)} {format_ms(next_page)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Память на сообщество при запуске нескольких ботов в одном процессе.
+
+Запуск: python benchmarks/bench_tenants.py [количество сообществ]
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+TENANTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+
+def build_tenants(db_dir, count):
+    tenants = [
+        bot.Tenant(f"tenant{i}", f"{100000 + i}:fake-token", -1001000000000 - i, f"@channel{i}",
+                   db_name=os.path.join(db_dir, f"tenant{i}.db"))
+        for i in range(count)
+    ]
+    applications = [bot.build_application(tenant) for tenant in tenants]
+    return tenants, applications
+
+
+def main():
+    # Предупреждение PTB о per_message выводится на каждое приложение
+    warnings.simplefilter('ignore')
+    with tempfile.TemporaryDirectory() as db_dir:
+        # Справочник стран, локализация и модули telegram загружаются один раз на процесс
+        baseline_dir = os.path.join(db_dir, 'baseline')
+        os.mkdir(baseline_dir)
+        baseline_tenants, _ = build_tenants(baseline_dir, 1)
+        gc.collect()
+
+        tracemalloc.start()
+        tenants, applications = build_tenants(db_dir, TENANTS)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        for tenant in baseline_tenants + tenants:
+            tenant.db.conn.close()
+
+    print(f"tenants:              {TENANTS}")
+    print(f"total:                {size / 2 ** 20:8.2f} MiB")
+    print(f"per tenant:           {size / TENANTS / 2 ** 10:8.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,19 @@
 Telegram Bot для публикации фото с модерацией
 """
 
+import asyncio
+import html
+import json
+import signal
 import logging
 import sqlite3
 import re
 import os
-from datetime import datetime
-from typing import Dict, Optional, Tuple
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 from telegram import (
@@ -18,6 +25,7 @@ from telegram import (
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove
 )
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -25,16 +33,73 @@ from telegram.ext import (
     CallbackQueryHandler,
     ContextTypes,
     ConversationHandler,
+    TypeHandler,
     filters
 )
 
 # ========== НАСТРОЙКА ==========
 load_dotenv()
 
+# Файл со списком сообществ (JSON) для запуска нескольких ботов в одном процессе.
+# Поля: name, bot_token, moderator_group_id, channel_id и необязательные channel_routes, db_name,
+# digest_mode, digest_interval, digest_thread_id (по умолчанию - значения из переменных ниже).
+# Если не задан - запускается один бот с настройками ниже
+TENANTS_FILE = os.getenv('TENANTS_FILE')
+
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 MODERATOR_GROUP_ID = int(os.getenv('MODERATOR_GROUP_ID', '-1001234567890'))
 CHANNEL_ID = os.getenv('CHANNEL_ID', '@your_channel')
 
+# Правила маршрутизации по каналам, например:
+# "lang:ru=@ru_channel,@main;country:ua=@ua_channel;*=@main"
+# Если правила не заданы - публикуем только в CHANNEL_ID
+CHANNEL_ROUTES = os.getenv('CHANNEL_ROUTES', '')
+DB_NAME = os.getenv('DB_NAME', 'bot_database.db')
+
+# Outbox: исходящие действия в Telegram доставляются фоновым обработчиком
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '1'))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', '5'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BASE_DELAY = float(os.getenv('OUTBOX_BASE_DELAY', '2'))
+OUTBOX_MAX_DELAY = float(os.getenv('OUTBOX_MAX_DELAY', '600'))
+# Сколько дней хранить доставленные действия
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+OUTBOX_PRUNE_INTERVAL = int(os.getenv('OUTBOX_PRUNE_INTERVAL', '3600'))
+
+# Режим дайджеста: информационные сообщения модераторам копятся и раз в DIGEST_INTERVAL
+# уходят одним сообщением на всю группу (в тему DIGEST_THREAD_ID или в общую).
+# Значения по умолчанию для сообществ: тема существует только в своей группе
+DIGEST_MODE = os.getenv('DIGEST_MODE', 'false').lower() in ('1', 'true', 'yes')
+DIGEST_INTERVAL = int(os.getenv('DIGEST_INTERVAL', '60'))
+DIGEST_THREAD_ID = int(os.getenv('DIGEST_THREAD_ID')) if os.getenv('DIGEST_THREAD_ID') else None
+# Пауза между частями длинного дайджеста: лимит группы около 20 сообщений в минуту
+DIGEST_SEND_INTERVAL = float(os.getenv('DIGEST_SEND_INTERVAL', '3'))
+# Сколько строк дайджеста отправляется за один сброс, остальные ждут следующего
+DIGEST_MAX_LINES = int(os.getenv('DIGEST_MAX_LINES', '500'))
+
+# Через сколько секунд бездействия незаконченный черновик поста удаляется
+CONVERSATION_TIMEOUT = int(os.getenv('CONVERSATION_TIMEOUT', '1800'))
+DRAFT_CLEANUP_INTERVAL = int(os.getenv('DRAFT_CLEANUP_INTERVAL', '600'))
+
+# Сколько постов показывать на одной странице /search
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '10'))
+# Сколько секунд может идти поиск по началу слов: длинное начало вроде 'surnam'
+# совпадает с тысячами разных слов, и такой запрос прерывается. FTS5 проверяет время
+# не чаще одного чтения списка слова, поэтому запрос может занять на несколько мс больше
+SEARCH_PREFIX_TIMEOUT = float(os.getenv('SEARCH_PREFIX_TIMEOUT', '0.005'))
+# Сколько последних запросов помнить в чате для перехода по страницам
+MAX_REMEMBERED_SEARCHES = 100
+
+# Рассылка всем пользователям: не больше BROADCAST_RATE сообщений в секунду
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '10'))
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '100'))
+BROADCAST_RETRIES = int(os.getenv('BROADCAST_RETRIES', '3'))
+
+# Лимит длины текста сообщения в Telegram
+MAX_MESSAGE_LENGTH = 4096
+
 # Состояния для FSM
 SELECTING_LANGUAGE, WAITING_PHOTO, WAITING_AGE, WAITING_COUNTRY, WAITING_ANON, WAITING_USERNAME = range(6)
 
@@ -67,7 +132,8 @@ LOCALIZATION = {
         'no_username': "You don't have a username (@nickname) set in your Telegram profile.\n\nTo post non-anonymously, you need to set a username in Telegram settings.\n\nOptions:\n1. Set a username in Telegram and try again\n2. Post anonymously (send 'anon')",
         'username_required': "Please provide your Telegram username (with @) or choose to post anonymously.",
         'enter_username': "Please enter your Telegram username (with @, e.g., @username):",
-        'invalid_username': "Username should start with @. Please enter a valid username or send 'anon' to post anonymously:"
+        'invalid_username': "Username should start with @ and be 5-32 characters long: Latin letters, digits and _, starting with a letter. Please enter a valid username or send 'anon' to post anonymously:",
+        'draft_expired': "⌛ Your unfinished post has expired. Send /start to begin again."
     },
     'ru': {
         'welcome': "Привет, {name}! 👋\nЯ бот для отправки фото. Пожалуйста, выберите язык:",
@@ -90,16 +156,43 @@ LOCALIZATION = {
         'no_username': "У вас не установлен username (@никнейм) в Telegram.\n\nДля публикации не анонимно нужно установить username в настройках Telegram.\n\nВарианты:\n1. Установите username в Telegram и попробуйте снова\n2. Опубликуйте анонимно (отправьте 'анон')",
         'username_required': "Пожалуйста, укажите ваш Telegram username (с @) или выберите анонимную публикацию.",
         'enter_username': "Пожалуйста, введите ваш Telegram username (с @, например, @username):",
-        'invalid_username': "Username должен начинаться с @. Пожалуйста, введите правильный username или отправьте 'анон' для анонимной публикации:"
+        'invalid_username': "Username должен начинаться с @ и содержать 5-32 символа: латинские буквы, цифры и _, первый символ - буква. Пожалуйста, введите правильный username или отправьте 'анон' для анонимной публикации:",
+        'draft_expired': "⌛ Время на заполнение поста истекло. Отправьте /start, чтобы начать заново."
     }
 }
 
+# ========== ЧЕРНОВИК ПОСТА ==========
+class Draft:
+    """Данные пользователя в процессе создания поста (используется как context.user_data)"""
+
+    __slots__ = ('photo_id', 'age', 'country', 'country_emoji', 'is_anonymous', 'display_username', 'updated_at')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.photo_id: Optional[str] = None
+        self.age: Optional[int] = None
+        self.country: Optional[str] = None
+        self.country_emoji: Optional[str] = None
+        self.is_anonymous = True
+        self.display_username: Optional[str] = None
+        self.updated_at = time.monotonic()
+
+    def touch(self):
+        self.updated_at = time.monotonic()
+
+    def is_stale(self, now: float) -> bool:
+        return now - self.updated_at > CONVERSATION_TIMEOUT
+
 # ========== БАЗА ДАННЫХ ==========
 class Database:
     def __init__(self, db_name='bot_database.db'):
         self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self._transaction_depth = 0
         self.create_tables()
         self.migrate_tables()
+        self.search_enabled = self.create_search_index()
 
     def create_tables(self):
         cursor = self.conn.cursor()
@@ -112,7 +205,8 @@ class Database:
                 full_name TEXT,
                 language TEXT DEFAULT 'en',
                 topic_id INTEGER,
-                reg_date TIMESTAMP
+                reg_date TIMESTAMP,
+                is_active INTEGER DEFAULT 1
             )
         ''')
 
@@ -135,6 +229,51 @@ class Database:
                 FOREIGN KEY (user_id) REFERENCES users (user_id)
             )
         ''')
+
+        # Таблица публикаций поста по каналам
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS post_channels (
+                post_id INTEGER,
+                channel_id TEXT,
+                message_id INTEGER,
+                status TEXT DEFAULT 'pending',
+                error TEXT,
+                published_at TIMESTAMP,
+                PRIMARY KEY (post_id, channel_id),
+                FOREIGN KEY (post_id) REFERENCES posts (post_id)
+            )
+        ''')
+
+        # Очередь исходящих действий в Telegram
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                action TEXT,
+                payload TEXT,
+                idempotency_key TEXT UNIQUE,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)')
+
+        # Рассылки с позицией, на которой они остановились
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                texts TEXT,
+                status TEXT DEFAULT 'running',
+                cursor_user_id INTEGER DEFAULT 0,
+                sent INTEGER DEFAULT 0,
+                blocked INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                created_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
         self.conn.commit()
 
     def migrate_tables(self):
@@ -150,6 +289,10 @@ class Database:
                 cursor.execute('ALTER TABLE users ADD COLUMN topic_id INTEGER')
                 logging.info("Added topic_id column to users table")
 
+            if 'is_active' not in columns:
+                cursor.execute('ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1')
+                logging.info("Added is_active column to users table")
+
             # Проверяем есть ли колонка mod_message_id в таблице posts
             cursor.execute("PRAGMA table_info(posts)")
             columns = [column[1] for column in cursor.fetchall()]
@@ -168,23 +311,110 @@ class Database:
             logging.error(f"Error during migration: {e}")
             self.conn.rollback()
 
+    def create_search_index(self):
+        """Полнотекстовый индекс постов для /search, обновляется триггерами"""
+        cursor = self.conn.cursor()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts (user_id)')
+
+        try:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'")
+            index_exists = cursor.fetchone() is not None
+
+            # rowid индекса совпадает с post_id. Начала слов из 2-4 символов индексируются отдельно:
+            # без этого 'alex*' объединяет списки всех слов на 'alex' и на миллионах постов идет ~20 мс
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5 (
+                    display_username, country, full_name, username,
+                    prefix = '2 3 4'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+                    INSERT INTO posts_fts (rowid, display_username, country, full_name, username)
+                    SELECT new.post_id, new.display_username, new.country, users.full_name, users.username
+                    FROM (SELECT 1) LEFT JOIN users ON users.user_id = new.user_id;
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS posts_fts_update
+                AFTER UPDATE OF user_id, display_username, country ON posts BEGIN
+                    DELETE FROM posts_fts WHERE rowid = old.post_id;
+                    INSERT INTO posts_fts (rowid, display_username, country, full_name, username)
+                    SELECT new.post_id, new.display_username, new.country, users.full_name, users.username
+                    FROM (SELECT 1) LEFT JOIN users ON users.user_id = new.user_id;
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+                    DELETE FROM posts_fts WHERE rowid = old.post_id;
+                END
+            ''')
+            # add_user перезаписывает имя при каждом /start - переиндексируем только при изменении
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS users_fts_update
+                AFTER UPDATE OF username, full_name ON users
+                WHEN old.username IS NOT new.username OR old.full_name IS NOT new.full_name BEGIN
+                    UPDATE posts_fts SET full_name = new.full_name, username = new.username
+                    WHERE rowid IN (SELECT post_id FROM posts WHERE user_id = new.user_id);
+                END
+            ''')
+
+            if not index_exists:
+                # Индексируем посты, созданные до появления поиска
+                cursor.execute('''
+                    INSERT INTO posts_fts (rowid, display_username, country, full_name, username)
+                    SELECT posts.post_id, posts.display_username, posts.country, users.full_name, users.username
+                    FROM posts LEFT JOIN users ON users.user_id = posts.user_id
+                ''')
+                logging.info("Created full-text search index for posts")
+
+            self.conn.commit()
+            return True
+
+        except sqlite3.OperationalError as e:
+            # SQLite собран без FTS5 - остается только поиск по user id
+            logging.warning(f"Full-text search is unavailable: {e}")
+            self.conn.rollback()
+            return False
+
+    @contextmanager
+    def transaction(self):
+        """Объединяет несколько вызовов в одну транзакцию (внутри не должно быть await)"""
+        self._transaction_depth += 1
+        try:
+            yield
+        except Exception:
+            self.conn.rollback()
+            raise
+        else:
+            if self._transaction_depth == 1:
+                self.conn.commit()
+        finally:
+            self._transaction_depth -= 1
+
+    def _commit(self):
+        if not self._transaction_depth:
+            self.conn.commit()
+
     def add_user(self, user_id, username, full_name):
         cursor = self.conn.cursor()
         cursor.execute('''
-            INSERT OR IGNORE INTO users (user_id, username, full_name, reg_date)
+            INSERT INTO users (user_id, username, full_name, reg_date)
             VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE
+            SET username = excluded.username, full_name = excluded.full_name, is_active = 1
         ''', (user_id, username, full_name, datetime.now()))
-        self.conn.commit()
+        self._commit()
 
     def set_user_language(self, user_id, language):
         cursor = self.conn.cursor()
         cursor.execute('UPDATE users SET language = ? WHERE user_id = ?', (language, user_id))
-        self.conn.commit()
+        self._commit()
 
     def set_user_topic(self, user_id, topic_id):
         cursor = self.conn.cursor()
         cursor.execute('UPDATE users SET topic_id = ? WHERE user_id = ?', (topic_id, user_id))
-        self.conn.commit()
+        self._commit()
 
     def get_user_language(self, user_id):
         cursor = self.conn.cursor()
@@ -206,7 +436,7 @@ class Database:
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, photo_id, age, country, country_emoji, is_anonymous, display_username, mod_chat_id, mod_message_id, datetime.now()))
         post_id = cursor.lastrowid
-        self.conn.commit()
+        self._commit()
         return post_id
 
     def update_post_status(self, post_id, status, mod_message_id=None):
@@ -223,7 +453,7 @@ class Database:
                 SET status = ?, published_at = ? 
                 WHERE post_id = ?
             ''', (status, datetime.now() if status == 'published' else None, post_id))
-        self.conn.commit()
+        self._commit()
 
     def get_post(self, post_id):
         cursor = self.conn.cursor()
@@ -239,13 +469,238 @@ class Database:
         result = cursor.fetchone()
         return dict(zip(columns, result)) if result else None
 
-# Глобальный экземпляр базы данных
-db = Database()
+    def set_user_inactive(self, user_id):
+        cursor = self.conn.cursor()
+        cursor.execute('UPDATE users SET is_active = 0 WHERE user_id = ?', (user_id,))
+        self._commit()
+
+    def get_active_users_after(self, after_user_id, limit):
+        """Следующая порция активных пользователей по возрастанию user_id"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT user_id, language FROM users
+            WHERE user_id > ? AND is_active = 1
+            ORDER BY user_id
+            LIMIT ?
+        ''', (after_user_id, limit))
+        return [{'user_id': row[0], 'language': row[1]} for row in cursor.fetchall()]
+
+    def create_broadcast(self, texts):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO broadcasts (texts, created_at)
+            VALUES (?, ?)
+        ''', (json.dumps(texts, ensure_ascii=False), datetime.now()))
+        broadcast_id = cursor.lastrowid
+        self._commit()
+        return broadcast_id
+
+    def get_broadcast(self, broadcast_id):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT * FROM broadcasts WHERE broadcast_id = ?', (broadcast_id,))
+        columns = [column[0] for column in cursor.description]
+        result = cursor.fetchone()
+        return dict(zip(columns, result)) if result else None
+
+    def get_running_broadcast_ids(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT broadcast_id FROM broadcasts WHERE status = 'running' ORDER BY broadcast_id")
+        return [row[0] for row in cursor.fetchall()]
+
+    def update_broadcast_progress(self, broadcast_id, cursor_user_id, sent, blocked, failed):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE broadcasts
+            SET cursor_user_id = ?, sent = sent + ?, blocked = blocked + ?, failed = failed + ?
+            WHERE broadcast_id = ?
+        ''', (cursor_user_id, sent, blocked, failed, broadcast_id))
+        self._commit()
+
+    def finish_broadcast(self, broadcast_id):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE broadcasts
+            SET status = 'done', finished_at = ?
+            WHERE broadcast_id = ?
+        ''', (datetime.now(), broadcast_id))
+        self._commit()
+
+    def search_posts(self, query, before_post_id=None, limit=SEARCH_PAGE_SIZE):
+        """Посты по user id или по словам из username, страны и имени, новые первыми.
+
+        None - поиск по началу слов не уложился в SEARCH_PREFIX_TIMEOUT
+        """
+        before_post_id = before_post_id or 2 ** 63 - 1
+        cursor = self.conn.cursor()
+
+        # isdigit() пропускает '²' и другие цифры, которые int() не разбирает
+        if re.fullmatch(r'[0-9]+', query):
+            cursor.execute('''
+                SELECT * FROM posts
+                WHERE user_id = ? AND post_id < ?
+                ORDER BY post_id DESC
+                LIMIT ?
+            ''', (int(query), before_post_id, limit))
+            rows = cursor.fetchall()
+        else:
+            # Все слова должны совпасть целиком; если таких постов нет - ищем по началу слов.
+            # Префиксный поиск по частым словам медленный, поэтому только как запасной вариант
+            terms = re.findall(r'\w+', query.lower())
+            if not terms or not self.search_enabled:
+                return []
+
+            # Время отсчитываем с начала поиска: проверка целых слов тоже его занимает
+            deadline = time.monotonic() + SEARCH_PREFIX_TIMEOUT
+            match = ' '.join(f'"{term}"' for term in terms)
+            cursor.execute('SELECT 1 FROM posts_fts WHERE posts_fts MATCH ? LIMIT 1', (match,))
+            by_prefix = cursor.fetchone() is None
+            if by_prefix:
+                match = ' '.join(f'"{term}"*' for term in terms)
+                # FTS5 объединяет списки слов внутри одного шага, поэтому проверяем часто
+                self.conn.set_progress_handler(lambda: time.monotonic() > deadline, 10)
+
+            try:
+                cursor.execute('''
+                    SELECT posts.* FROM posts_fts
+                    JOIN posts ON posts.post_id = posts_fts.rowid
+                    WHERE posts_fts MATCH ? AND posts_fts.rowid < ?
+                    ORDER BY posts_fts.rowid DESC
+                    LIMIT ?
+                ''', (match, before_post_id, limit))
+                rows = cursor.fetchall()
+            except sqlite3.OperationalError as e:
+                if not by_prefix or 'interrupted' not in str(e):
+                    raise
+                logging.info(f"Prefix search for {query!r} exceeded {SEARCH_PREFIX_TIMEOUT} s")
+                return None
+            finally:
+                self.conn.set_progress_handler(None, 0)
+
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def add_post_channels(self, post_id, channel_ids):
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO post_channels (post_id, channel_id)
+            VALUES (?, ?)
+        ''', [(post_id, channel_id) for channel_id in channel_ids])
+        self._commit()
+
+    def get_post_channels(self, post_id):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT * FROM post_channels WHERE post_id = ? ORDER BY rowid', (post_id,))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def set_post_channel_published(self, post_id, channel_id, message_id):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE post_channels
+            SET status = 'published', message_id = ?, error = NULL, published_at = ?
+            WHERE post_id = ? AND channel_id = ?
+        ''', (message_id, datetime.now(), post_id, channel_id))
+        self._commit()
+
+    def set_post_channel_failed(self, post_id, channel_id, error):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE post_channels
+            SET status = 'failed', error = ?
+            WHERE post_id = ? AND channel_id = ?
+        ''', (error, post_id, channel_id))
+        self._commit()
+
+    def enqueue_outbox(self, action, payload, idempotency_key=None):
+        """Ставит действие в outbox; повтор с тем же ключом игнорируется, если действие не ушло в dead"""
+        now = datetime.now()
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO outbox (action, payload, idempotency_key, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (idempotency_key) DO UPDATE
+            SET status = 'pending', attempts = 0, next_attempt_at = excluded.next_attempt_at, last_error = NULL
+            WHERE status = 'dead'
+        ''', (action, json.dumps(payload), idempotency_key, now, now))
+        self._commit()
+
+    def get_due_outbox(self, limit, exclude_actions=()):
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT * FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            AND action NOT IN ({', '.join('?' * len(exclude_actions))})
+            ORDER BY next_attempt_at, outbox_id
+            LIMIT ?
+        ''', (datetime.now(), *exclude_actions, limit))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_pending_outbox(self, action, limit):
+        """Ожидающие действия одного типа по порядку постановки"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT * FROM outbox
+            WHERE status = 'pending' AND action = ?
+            ORDER BY outbox_id
+            LIMIT ?
+        ''', (action, limit))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def complete_outbox(self, *outbox_ids):
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            "UPDATE outbox SET status = 'done', last_error = NULL WHERE outbox_id = ?",
+            [(outbox_id,) for outbox_id in outbox_ids]
+        )
+        self._commit()
+
+    def prune_outbox(self, older_than):
+        """Удаляет доставленные действия старше указанной даты, dead оставляем для разбора"""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM outbox WHERE status = 'done' AND created_at < ?", (older_than,))
+        self._commit()
+        return cursor.rowcount
+
+    def fail_outbox(self, outbox_id, attempts, next_attempt_at, error, dead=False):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE outbox
+            SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+            WHERE outbox_id = ?
+        ''', ('dead' if dead else 'pending', attempts, next_attempt_at, error, outbox_id))
+        self._commit()
+
+# ========== РАЗБОР ВВОДА ==========
+WHITESPACE_PATTERN = re.compile(r'\s+')
+FLAG_EMOJI_PATTERN = re.compile(r'[\U0001F1E6-\U0001F1FF]{2}')
+AGE_PATTERN = re.compile(r'[0-9]{1,3}')
+# Правила Telegram: 5-32 символа, латиница, цифры и _, начинается с буквы
+USERNAME_PATTERN = re.compile(r'@[A-Za-z][A-Za-z0-9_]{4,31}')
+
+MIN_AGE = 18
+MAX_AGE = 100
+MIN_COUNTRY_PREFIX = 3
+
+def normalize_input(text: str) -> str:
+    """Нижний регистр и одиночные пробелы"""
+    return WHITESPACE_PATTERN.sub(' ', text.strip()).lower()
+
+class UserInput:
+    """Текст сообщения, нормализованный один раз для всех проверок"""
+
+    __slots__ = ('raw', 'normalized')
+
+    def __init__(self, text: str):
+        self.raw = text.strip()
+        self.normalized = normalize_input(self.raw)
 
 # ========== УТИЛИТЫ ДЛЯ СТРАН ==========
 class CountryUtils:
     def __init__(self):
         self.country_cache = self._initialize_country_cache()
+        self.prefix_index = self._build_prefix_index()
 
     def _initialize_country_cache(self):
         cache = {}
@@ -275,6 +730,7 @@ class CountryUtils:
         for code, data in countries.items():
             cache[code] = data
             cache[data['name'].lower()] = data
+            cache[data['emoji']] = data
 
         russian_names = {
             'россия': countries['ru'],
@@ -327,32 +783,152 @@ class CountryUtils:
         cache.update(russian_names)
         return cache
 
+    def _build_prefix_index(self):
+        """Начала слов названий (от MIN_COUNTRY_PREFIX символов) -> страна.
+
+        Префикс, подходящий к нескольким странам ('united'), в таблицу не попадает:
+        лучше переспросить, чем угадать
+        """
+        matches: Dict[str, Dict[str, Dict]] = {}
+        for key, data in self.country_cache.items():
+            words = key.split(' ')
+            for i in range(len(words)):
+                # 'united st' тоже начало названия, поэтому берем хвосты с каждого слова
+                tail = ' '.join(words[i:])
+                for end in range(MIN_COUNTRY_PREFIX, len(tail) + 1):
+                    matches.setdefault(tail[:end], {})[data['emoji']] = data
+
+        return {prefix: next(iter(countries.values())) for prefix, countries in matches.items() if len(countries) == 1}
+
     def parse_country_input(self, text: str) -> Optional[Dict]:
-        text = text.strip().lower()
+        return self.lookup(normalize_input(text))
 
-        flag_emoji_pattern = re.compile(r'[\U0001F1E6-\U0001F1FF]{2}')
-        if flag_emoji_pattern.match(text):
+    def lookup(self, text: str) -> Optional[Dict]:
+        """Поиск страны по уже нормализованному вводу"""
+        if text in self.country_cache:
+            return self.country_cache[text]
+
+        if FLAG_EMOJI_PATTERN.fullmatch(text):
             return {
                 'name': text.upper(),
                 'emoji': text,
                 'code': '??'
             }
 
-        if text in self.country_cache:
-            return self.country_cache[text]
+        # Ищем только начало слова: по середине слова 'land' нашлась бы Poland, 'ain' - Spain
+        return self.prefix_index.get(text)
 
-        for key, data in self.country_cache.items():
-            if isinstance(key, str) and text in key:
-                return data
+country_utils = CountryUtils()
 
-        return None
+class InputClassifier:
+    """Разбор ответов пользователя на шагах создания поста"""
 
-country_utils = CountryUtils()
+    # Варианты выбора анонимности по языкам
+    ANON_KEYWORDS = {
+        'en': {
+            False: ['not anon', 'not anonymous', 'not anonymously'],
+            True: ['anon', 'anonymous', 'anonymously'],
+        },
+        'ru': {
+            False: ['не анон', 'не анонимно', 'неанон', 'неанонимно'],
+            True: ['анон', 'анонимно'],
+        },
+    }
+
+    def __init__(self):
+        self.anon_patterns = {lang: self._compile_anon_pattern(lang) for lang in SUPPORTED_LANGUAGES}
+
+    def _compile_anon_pattern(self, lang: str):
+        """Одно регулярное выражение на язык: свои слова, затем слова остальных языков"""
+        tables = [self.ANON_KEYWORDS[lang]] + [
+            table for other_lang, table in self.ANON_KEYWORDS.items() if other_lang != lang
+        ]
+
+        def alternation(choice: bool) -> str:
+            keywords = [keyword for table in tables for keyword in table[choice]]
+            return '|'.join(re.escape(keyword) for keyword in keywords)
+
+        # Слова целиком, поэтому 'not anon' не совпадает с 'anon', а 'анонимно' с 'анон'
+        return re.compile(rf'(?<!\w)(?:(?P<not_anon>{alternation(False)})|(?P<anon>{alternation(True)}))(?!\w)')
+
+    def classify_age(self, user_input: UserInput) -> Tuple[Optional[int], Optional[str]]:
+        """Возвращает (возраст, None) или (None, ключ текста ошибки)"""
+        if not AGE_PATTERN.fullmatch(user_input.normalized):
+            return None, 'invalid_age'
+
+        age = int(user_input.normalized)
+        if age < MIN_AGE or age > MAX_AGE:
+            return None, 'age_limits'
+
+        return age, None
+
+    def classify_anon(self, user_input: UserInput, lang: str) -> Optional[bool]:
+        """True - анонимно, False - не анонимно, None - не распознано"""
+        pattern = self.anon_patterns.get(lang, self.anon_patterns['en'])
+        match = pattern.search(user_input.normalized)
+        if not match:
+            return None
+        return match.lastgroup == 'anon'
+
+    def classify_username(self, user_input: UserInput) -> Optional[str]:
+        """Username в исходном регистре, если он допустим"""
+        return user_input.raw if USERNAME_PATTERN.fullmatch(user_input.raw) else None
+
+    def classify_country(self, user_input: UserInput) -> Optional[Dict]:
+        return country_utils.lookup(user_input.normalized)
+
+input_classifier = InputClassifier()
+
+# ========== МАРШРУТИЗАЦИЯ ПО КАНАЛАМ ==========
+class ChannelRouter:
+    """Определяет каналы публикации поста по языку и стране"""
+
+    def __init__(self, routes: str, default_channel: str):
+        self.default_channels: List[str] = []
+        self.language_routes: Dict[str, List[str]] = {}
+        self.country_routes: Dict[str, List[str]] = {}
+        self._parse_routes(routes)
+
+        if not self.default_channels:
+            self.default_channels = [default_channel]
+
+    def _parse_routes(self, routes: str):
+        for rule in routes.split(';'):
+            if not rule.strip():
+                continue
+
+            key, _, channels = rule.partition('=')
+            key = key.strip().lower()
+            channel_ids = [c.strip() for c in channels.split(',') if c.strip()]
+            if not channel_ids:
+                logging.warning(f"Channel route without channels: {rule}")
+                continue
+
+            if key == '*':
+                self.default_channels.extend(channel_ids)
+            elif key.startswith('lang:'):
+                self.language_routes.setdefault(key[5:], []).extend(channel_ids)
+            elif key.startswith('country:'):
+                # Страну приводим к эмодзи, чтобы принимать код, название или флаг
+                country_data = country_utils.parse_country_input(key[8:])
+                if not country_data:
+                    logging.warning(f"Unknown country in channel route: {rule}")
+                    continue
+                self.country_routes.setdefault(country_data['emoji'], []).extend(channel_ids)
+            else:
+                logging.warning(f"Unknown channel route: {rule}")
+
+    def get_targets(self, post: Dict, lang: str) -> List[str]:
+        """Список каналов для поста без повторов"""
+        targets = self.language_routes.get(lang, []) + self.country_routes.get(post['country_emoji'], [])
+        if not targets:
+            targets = self.default_channels
+        return list(dict.fromkeys(targets))
 
 # ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
 def get_user_language(user_id: int) -> str:
     """Получить язык пользователя"""
-    return db.get_user_language(user_id)
+    return get_db().get_user_language(user_id)
 
 def get_text(key: str, user_id: int, **kwargs) -> str:
     """Получить локализованный текст"""
@@ -360,6 +936,23 @@ def get_text(key: str, user_id: int, **kwargs) -> str:
     text = LOCALIZATION[lang].get(key, key)
     return text.format(**kwargs) if kwargs else text
 
+async def touch_draft(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Любое обновление от пользователя продлевает жизнь его черновика,
+    даже если шаг не прошел проверку (таймаут ConversationHandler тоже сбрасывается)"""
+    if not update.effective_user:
+        return
+
+    # Через get, чтобы не создавать черновики для тех, у кого их нет
+    draft = context.application.user_data.get(update.effective_user.id)
+    if draft is not None:
+        draft.touch()
+
+def get_draft(context: ContextTypes.DEFAULT_TYPE) -> Draft:
+    """Черновик пользователя с отметкой об активности"""
+    draft = context.user_data
+    draft.touch()
+    return draft
+
 def get_language_keyboard():
     """Клавиатура для выбора языка"""
     keyboard = [
@@ -387,26 +980,12 @@ def get_moderation_keyboard(post_id: int):
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def parse_anon_input(text: str, lang: str) -> Optional[bool]:
-    """Парсит ввод анонимности"""
-    text_lower = text.strip().lower()
-
-    if lang == 'ru':
-        anon_keywords = ['анон', 'анонимно', 'anon', 'anonymous']
-        not_anon_keywords = ['не анон', 'не анонимно', 'не anon', 'not anon', 'not anonymous']
-    else:
-        anon_keywords = ['anon', 'anonymous', 'анон', 'анонимно']
-        not_anon_keywords = ['not anon', 'not anonymous', 'не анон', 'не анонимно']
-
-    for keyword in anon_keywords:
-        if keyword in text_lower:
-            return True
-
-    for keyword in not_anon_keywords:
-        if keyword in text_lower:
-            return False
-
-    return None
+def get_retry_keyboard(post_id: int):
+    """Инлайн-клавиатура для повторной публикации в неудачные каналы"""
+    keyboard = [
+        [InlineKeyboardButton("🔁 Повторить", callback_data=f"approve_{post_id}")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
 
 def format_post_text(country_emoji: str, user_display: str, age: int) -> str:
     """Форматирует текст поста с HTML разметкой"""
@@ -421,16 +1000,391 @@ def format_post_text(country_emoji: str, user_display: str, age: int) -> str:
 
     return f"{country_emoji} {user_text}\n\n{age_text}\n\n{post_text}"
 
-def is_valid_username(username: str) -> bool:
-    """Проверяет валидность username"""
-    username = username.strip()
-    return username.startswith('@') and len(username) > 1
+# ========== СООБЩЕНИЯ МОДЕРАТОРАМ ==========
+class ModeratorDigest:
+    """Дайджест для всей группы модераторов.
+
+    Строки дайджеста - это действия moderator_note в outbox: в режиме дайджеста обработчик
+    outbox их пропускает, а сброс отмечает доставленными только после отправки сообщения,
+    поэтому при падении бота ничего не теряется.
+    """
+
+    def __init__(self, db: 'Database', chat_id: int, thread_id: Optional[int] = None):
+        self.db = db
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+
+    async def flush(self, bot):
+        """Отправляет накопленное одним сообщением (или несколькими с паузой, если не влезает в лимит)"""
+        # Склеиваем строки в сообщения, не превышающие лимит Telegram
+        chunks: List[Tuple[str, List[Dict]]] = []
+        for entry in self.db.get_pending_outbox('moderator_note', DIGEST_MAX_LINES):
+            line = json.loads(entry['payload'])['text'][:MAX_MESSAGE_LENGTH]
+            if chunks and len(chunks[-1][0]) + len(line) + 1 <= MAX_MESSAGE_LENGTH:
+                chunks[-1] = (chunks[-1][0] + '\n' + line, chunks[-1][1] + [entry])
+            else:
+                chunks.append((line, [entry]))
+
+        for index, (text, entries) in enumerate(chunks):
+            if index:
+                await asyncio.sleep(DIGEST_SEND_INTERVAL)
+            try:
+                await bot.send_message(
+                    chat_id=self.chat_id,
+                    message_thread_id=self.thread_id,
+                    text=text
+                )
+            except Exception as e:
+                logging.error(f"Error sending moderator digest: {e}")
+                # Как в deliver_outbox_entry: постоянные ошибки и исчерпанные попытки - в dead,
+                # остальные строки останутся в outbox до следующего сброса
+                permanent = isinstance(e, OUTBOX_PERMANENT_ERRORS)
+                with self.db.transaction():
+                    for entry in entries:
+                        attempts = entry['attempts'] + 1
+                        self.db.fail_outbox(
+                            entry['outbox_id'],
+                            attempts,
+                            datetime.now(),
+                            str(e),
+                            permanent or attempts >= OUTBOX_MAX_ATTEMPTS
+                        )
+                if permanent:
+                    continue
+                break
+
+            self.db.complete_outbox(*(entry['outbox_id'] for entry in entries))
+
+# ========== ПОИСК ==========
+def get_message_link(chat_id: int, message_id: Optional[int]) -> Optional[str]:
+    """Ссылка на сообщение в супергруппе"""
+    chat_id = str(chat_id)
+    if not message_id or not chat_id.startswith('-100'):
+        return None
+    return f"https://t.me/c/{chat_id[4:]}/{message_id}"
+
+def build_search_page(query: str, before_post_id: Optional[int] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Текст страницы результатов и кнопка следующей страницы"""
+    # Берем на один пост больше, чтобы понять, есть ли следующая страница
+    posts = get_db().search_posts(query, before_post_id, SEARCH_PAGE_SIZE + 1)
+    if posts is None:
+        return f"🔍 Too many words start with: {html.escape(query)}\nType more letters or whole words", None
+
+    has_next = len(posts) > SEARCH_PAGE_SIZE
+    posts = posts[:SEARCH_PAGE_SIZE]
+
+    if not posts:
+        return f"🔍 Nothing found for: {html.escape(query)}", None
+
+    lines = [f"🔍 Results for: {html.escape(query)}\n"]
+    for post in posts:
+        title = f"#{post['post_id']} {html.escape(post['display_username'] or '')}"
+        link = get_message_link(post['mod_chat_id'], post['mod_message_id'])
+        if link:
+            title = f'<a href="{link}">{title}</a>'
+        lines.append(
+            f"{title} · {post['country_emoji'] or ''} {html.escape(post['country'] or '')} · "
+            f"user {post['user_id']} · {post['status']}"
+        )
+
+    keyboard = None
+    if has_next:
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("➡️ Next", callback_data=f"search_{posts[-1]['post_id']}")]
+        ])
+    return '\n'.join(lines), keyboard
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск постов модераторами: /search <username, страна или user id>"""
+    query = ' '.join(context.args).strip()
+    if not query:
+        await update.message.reply_text("Usage: /search <username, country or user id>")
+        return
+
+    text, keyboard = build_search_page(query)
+    message = await update.message.reply_text(
+        text,
+        parse_mode='HTML',
+        reply_markup=keyboard,
+        disable_web_page_preview=True
+    )
+
+    # Запрос нужен для следующих страниц, кнопка хранит только позицию
+    searches = context.chat_data.setdefault('searches', {})
+    searches[message.message_id] = query
+    while len(searches) > MAX_REMEMBERED_SEARCHES:
+        searches.pop(next(iter(searches)))
+
+async def search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Следующая страница результатов поиска"""
+    query = update.callback_query
+    search_query = context.chat_data.get('searches', {}).get(query.message.message_id)
+    if not search_query:
+        await query.answer("Search expired, run /search again")
+        return
+
+    await query.answer()
+    text, keyboard = build_search_page(search_query, int(query.data.replace('search_', '')))
+    await query.edit_message_text(
+        text,
+        parse_mode='HTML',
+        reply_markup=keyboard,
+        disable_web_page_preview=True
+    )
+
+# ========== РАССЫЛКА ==========
+BROADCAST_LANGUAGE_PATTERN = re.compile(r'^\[(\w+)\][ \t]*', re.MULTILINE)
+
+class RateLimiter:
+    """Равномерно распределяет вызовы: не больше rate в секунду"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_time = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            delay = self.next_time - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_time = max(self.next_time, loop.time()) + self.interval
+
+    def pause(self, seconds: float):
+        """Telegram попросил подождать - притормаживаем все отправки"""
+        self.next_time = max(self.next_time, asyncio.get_running_loop().time() + seconds)
+
+def parse_broadcast_texts(text: str) -> Dict[str, str]:
+    """Тексты рассылки по языкам: строки вида '[en] ...' и '[ru] ...', без меток - один текст для всех"""
+    parts = BROADCAST_LANGUAGE_PATTERN.split(text)
+    texts = {}
+
+    if parts[0].strip():
+        texts['en'] = parts[0].strip()
+
+    for lang, body in zip(parts[1::2], parts[2::2]):
+        if lang not in SUPPORTED_LANGUAGES:
+            raise ValueError(f"Unsupported language: {lang}")
+        if body.strip():
+            texts[lang] = body.strip()
+
+    return texts
+
+def get_broadcast_text(texts: Dict[str, str], lang: str) -> str:
+    return texts.get(lang) or texts.get('en') or next(iter(texts.values()))
+
+async def send_broadcast_message(bot, limiter: RateLimiter, user_id: int, text: str) -> str:
+    """Отправляет одно сообщение рассылки, возвращает 'sent', 'blocked' или 'failed'"""
+    for attempt in range(1, BROADCAST_RETRIES + 1):
+        await limiter.wait()
+        try:
+            await bot.send_message(chat_id=user_id, text=text)
+            return 'sent'
+        except RetryAfter as e:
+            limiter.pause(e.retry_after)
+        except Forbidden:
+            # Пользователь заблокировал бота или удалил аккаунт
+            return 'blocked'
+        except BadRequest as e:
+            if 'chat not found' in str(e).lower():
+                return 'blocked'
+            logging.error(f"Broadcast to {user_id} failed: {e}")
+            return 'failed'
+        except NetworkError as e:
+            logging.error(f"Broadcast to {user_id} failed (attempt {attempt}): {e}")
+        except Exception as e:
+            # Ошибка одного получателя не должна останавливать всю рассылку
+            logging.error(f"Broadcast to {user_id} failed: {e}")
+            return 'failed'
+
+    return 'failed'
+
+async def run_broadcast(bot, broadcast_id: int):
+    """Рассылка с места последней сохраненной позиции"""
+    tenant = get_tenant()
+    db = tenant.db
+
+    try:
+        broadcast = db.get_broadcast(broadcast_id)
+        texts = json.loads(broadcast['texts'])
+        cursor_user_id = broadcast['cursor_user_id']
+        # Лимит общий для всех рассылок сообщества: Telegram ограничивает бота, а не рассылку
+        limiter = tenant.broadcast_limiter
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+        async def send(user: Dict) -> str:
+            async with semaphore:
+                text = get_broadcast_text(texts, user['language'])
+                return await send_broadcast_message(bot, limiter, user['user_id'], text)
+
+        while True:
+            # Пользователей читаем порциями по user_id, чтобы не держать всех в памяти
+            users = db.get_active_users_after(cursor_user_id, BROADCAST_BATCH_SIZE)
+            if not users:
+                break
+
+            results = await asyncio.gather(*(send(user) for user in users))
+            cursor_user_id = users[-1]['user_id']
+
+            # Позиция сохраняется после каждой порции: после перезапуска
+            # повторно могут уйти только сообщения незавершенной порции
+            with db.transaction():
+                for user, result in zip(users, results):
+                    if result == 'blocked':
+                        db.set_user_inactive(user['user_id'])
+                db.update_broadcast_progress(
+                    broadcast_id,
+                    cursor_user_id,
+                    results.count('sent'),
+                    results.count('blocked'),
+                    results.count('failed')
+                )
+
+        db.finish_broadcast(broadcast_id)
+        broadcast = db.get_broadcast(broadcast_id)
+        await bot.send_message(
+            chat_id=tenant.moderator_group_id,
+            text=(
+                f"📣 Broadcast #{broadcast_id} finished: sent {broadcast['sent']}, "
+                f"blocked {broadcast['blocked']}, failed {broadcast['failed']}"
+            )
+        )
+
+    except Exception as e:
+        logging.error(f"Broadcast #{broadcast_id} stopped: {e}")
+
+def start_broadcast(bot, broadcast_id: int):
+    """Запускает рассылку в фоне, если она еще не идет.
+
+    Задача создается не через application.create_task: PTB ждет такие задачи
+    при остановке, и SIGTERM зависал бы до конца рассылки. Вместо этого
+    задачи отменяются в stop_broadcasts, а рассылка продолжается после перезапуска.
+    """
+    tenant = get_tenant()
+    if broadcast_id in tenant.broadcast_tasks:
+        return
+    task = asyncio.create_task(run_broadcast(bot, broadcast_id))
+    tenant.broadcast_tasks[broadcast_id] = task
+    task.add_done_callback(lambda _: tenant.broadcast_tasks.pop(broadcast_id, None))
+
+async def stop_broadcasts(tenant):
+    """Прерывает рассылки сообщества; статус в базе остается 'running'"""
+    tasks = list(tenant.broadcast_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рассылка всем пользователям: /broadcast <текст> или строки '[en] ...', '[ru] ...'"""
+    command_parts = update.message.text.split(maxsplit=1)
+
+    try:
+        texts = parse_broadcast_texts(command_parts[1] if len(command_parts) > 1 else '')
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    if not texts:
+        await update.message.reply_text("Usage: /broadcast <text>\nor one line per language: [en] text, [ru] текст")
+        return
+
+    broadcast_id = get_db().create_broadcast(texts)
+    start_broadcast(context.bot, broadcast_id)
+    await update.message.reply_text(f"📣 Broadcast #{broadcast_id} started")
+
+async def resume_broadcasts_job(context: ContextTypes.DEFAULT_TYPE):
+    """Продолжает рассылки, прерванные остановкой бота"""
+    bind_job_tenant(context)
+    for broadcast_id in get_db().get_running_broadcast_ids():
+        logging.info(f"Resuming broadcast #{broadcast_id}")
+        start_broadcast(context.bot, broadcast_id)
+
+# ========== СООБЩЕСТВА ==========
+class Tenant:
+    """Одно сообщество: свой бот, группа модераторов, каналы и база данных"""
+
+    def __init__(self, name, bot_token, moderator_group_id, channel_id, channel_routes='', db_name=DB_NAME,
+                 digest_mode=DIGEST_MODE, digest_interval=DIGEST_INTERVAL, digest_thread_id=DIGEST_THREAD_ID):
+        self.name = name
+        self.bot_token = bot_token
+        self.moderator_group_id = int(moderator_group_id)
+        self.db = Database(db_name)
+        self.channel_router = ChannelRouter(channel_routes, channel_id)
+        self.digest_mode = digest_mode
+        self.digest_interval = digest_interval
+        self.digest = ModeratorDigest(self.db, self.moderator_group_id, digest_thread_id)
+        self.outbox_lock = asyncio.Lock()
+        self.broadcast_limiter = RateLimiter(BROADCAST_RATE)
+        self.broadcast_tasks: Dict[int, asyncio.Task] = {}
+
+# Сообщество, чье обновление или задача сейчас обрабатывается
+current_tenant: ContextVar[Tenant] = ContextVar('current_tenant')
+
+def get_tenant() -> Tenant:
+    return current_tenant.get()
+
+def get_db() -> Database:
+    return current_tenant.get().db
+
+async def bind_tenant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Привязывает обработку обновления к сообществу его бота"""
+    current_tenant.set(context.bot_data['tenant'])
+
+def bind_job_tenant(context: ContextTypes.DEFAULT_TYPE):
+    """Задачи JobQueue выполняются вне обработки обновлений - привязываем явно"""
+    current_tenant.set(context.bot_data['tenant'])
+
+def load_tenants() -> List[Tenant]:
+    """Сообщества из TENANTS_FILE или одно сообщество из переменных окружения"""
+    if not TENANTS_FILE:
+        return [Tenant('default', BOT_TOKEN, MODERATOR_GROUP_ID, CHANNEL_ID, CHANNEL_ROUTES)]
+
+    with open(TENANTS_FILE, encoding='utf-8') as f:
+        configs = json.load(f)
+
+    db_names = [config.get('db_name', f"bot_database_{config['name']}.db") for config in configs]
+    if len(set(db_names)) != len(db_names):
+        raise ValueError("Each tenant must use its own database file")
+
+    return [
+        Tenant(
+            name=config['name'],
+            bot_token=config['bot_token'],
+            moderator_group_id=config['moderator_group_id'],
+            channel_id=config['channel_id'],
+            channel_routes=config.get('channel_routes', ''),
+            db_name=db_name,
+            digest_mode=config.get('digest_mode', DIGEST_MODE),
+            digest_interval=config.get('digest_interval', DIGEST_INTERVAL),
+            digest_thread_id=config.get('digest_thread_id', DIGEST_THREAD_ID)
+        )
+        for config, db_name in zip(configs, db_names)
+    ]
+
+async def notify_moderators(bot, thread_id: Optional[int], text: str):
+    """Информационное сообщение в тему группы модераторов"""
+    await bot.send_message(
+        chat_id=get_tenant().moderator_group_id,
+        message_thread_id=thread_id,
+        text=text
+    )
+
+async def flush_digest_job(context: ContextTypes.DEFAULT_TYPE):
+    """Периодический сброс дайджеста"""
+    await context.bot_data['tenant'].digest.flush(context.bot)
+
+async def on_application_stop(application: Application):
+    """Прерываем рассылки и сбрасываем остаток дайджеста при остановке бота"""
+    tenant = application.bot_data['tenant']
+    await stop_broadcasts(tenant)
+    await tenant.digest.flush(application.bot)
 
 # ========== ОБРАБОТЧИКИ КОМАНД ==========
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
-    db.add_user(user.id, user.username, user.full_name)
+    get_db().add_user(user.id, user.username, user.full_name)
 
     await update.message.reply_text(
         get_text('welcome', user.id, name=user.first_name),
@@ -449,12 +1403,49 @@ async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена текущего действия"""
     user = update.effective_user
+    context.user_data.clear()
     await update.message.reply_text(
         get_text('cancel', user.id),
         reply_markup=ReplyKeyboardRemove()
     )
     return ConversationHandler.END
 
+async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пользователь не закончил пост вовремя - удаляем черновик и сообщаем ему"""
+    # Вызывается из задачи таймаута ConversationHandler, а не из обработки обновления
+    bind_job_tenant(context)
+    user = update.effective_user
+    # context.user_data создал бы заново черновик, который уже удалила очистка
+    draft = context.application.user_data.get(user.id)
+    context.application.drop_user_data(user.id)
+
+    # Пользователь выбрал язык, но так и не начал пост - сообщать не о чем
+    if draft is None or draft.photo_id is None:
+        return
+
+    try:
+        await context.bot.send_message(
+            chat_id=user.id,
+            text=get_text('draft_expired', user.id),
+            reply_markup=ReplyKeyboardRemove()
+        )
+    except Exception as e:
+        logging.error(f"Could not notify user about expired draft: {e}")
+
+async def cleanup_drafts_job(context: ContextTypes.DEFAULT_TYPE):
+    """Удаляет из памяти черновики, которые давно не обновлялись"""
+    now = time.monotonic()
+    stale_user_ids = [
+        user_id for user_id, draft in context.application.user_data.items()
+        if draft.is_stale(now)
+    ]
+
+    for user_id in stale_user_ids:
+        context.application.drop_user_data(user_id)
+
+    if stale_user_ids:
+        logging.info(f"Evicted {len(stale_user_ids)} stale drafts")
+
 async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка выбора языка"""
     query = update.callback_query
@@ -464,7 +1455,7 @@ async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     language = query.data.replace('lang_', '')
 
     if language in SUPPORTED_LANGUAGES:
-        db.set_user_language(user_id, language)
+        get_db().set_user_language(user_id, language)
         await query.edit_message_text(
             text=get_text('language_set', user_id)
         )
@@ -477,7 +1468,8 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение фото"""
     user = update.effective_user
     photo = update.message.photo[-1]
-    context.user_data['photo_id'] = photo.file_id
+    draft = get_draft(context)
+    draft.photo_id = photo.file_id
 
     await update.message.reply_text(
         get_text('send_photo', user.id)
@@ -487,18 +1479,13 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение возраста"""
     user = update.effective_user
-    age_text = update.message.text.strip()
+    age, error_key = input_classifier.classify_age(UserInput(update.message.text))
 
-    if not age_text.isdigit():
-        await update.message.reply_text(get_text('invalid_age', user.id))
+    if error_key:
+        await update.message.reply_text(get_text(error_key, user.id))
         return WAITING_AGE
 
-    age = int(age_text)
-    if age < 18 or age > 100:
-        await update.message.reply_text(get_text('age_limits', user.id))
-        return WAITING_AGE
-
-    context.user_data['age'] = age
+    get_draft(context).age = age
 
     await update.message.reply_text(
         get_text('enter_country', user.id),
@@ -509,15 +1496,15 @@ async def handle_age(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_country(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение страны"""
     user = update.effective_user
-    country_input = update.message.text.strip()
-    country_data = country_utils.parse_country_input(country_input)
+    country_data = input_classifier.classify_country(UserInput(update.message.text))
 
     if not country_data:
         await update.message.reply_text(get_text('country_clarification', user.id))
         return WAITING_COUNTRY
 
-    context.user_data['country'] = country_data['name']
-    context.user_data['country_emoji'] = country_data['emoji']
+    draft = get_draft(context)
+    draft.country = country_data['name']
+    draft.country_emoji = country_data['emoji']
 
     await update.message.reply_text(
         get_text('select_mode', user.id),
@@ -528,10 +1515,8 @@ async def handle_country(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_anon(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение выбора анонимности"""
     user = update.effective_user
-    choice = update.message.text
-
     lang = get_user_language(user.id)
-    is_anonymous = parse_anon_input(choice, lang)
+    is_anonymous = input_classifier.classify_anon(UserInput(update.message.text), lang)
 
     if is_anonymous is None:
         await update.message.reply_text(
@@ -542,8 +1527,9 @@ async def handle_anon(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if is_anonymous:
         # Если выбрана анонимность - сразу создаем пост
-        context.user_data['is_anonymous'] = True
-        context.user_data['display_username'] = "Anon"
+        draft = get_draft(context)
+        draft.is_anonymous = True
+        draft.display_username = "Anon"
         return await create_post(update, context)
     else:
         # Если выбрано не анонимно - проверяем наличие username
@@ -554,24 +1540,26 @@ async def handle_anon(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return WAITING_USERNAME
         else:
-            context.user_data['is_anonymous'] = False
-            context.user_data['display_username'] = f"@{user.username}"
+            draft = get_draft(context)
+            draft.is_anonymous = False
+            draft.display_username = f"@{user.username}"
             return await create_post(update, context)
 
 async def handle_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка ввода username"""
     user = update.effective_user
-    user_input = update.message.text.strip()
+    user_input = UserInput(update.message.text)
 
     # Проверяем, не хочет ли пользователь переключиться на анонимность
     lang = get_user_language(user.id)
-    is_anonymous = parse_anon_input(user_input, lang)
+    is_anonymous = input_classifier.classify_anon(user_input, lang)
 
     if is_anonymous is not None:
         if is_anonymous:
             # Пользователь выбрал анонимность
-            context.user_data['is_anonymous'] = True
-            context.user_data['display_username'] = "Anon"
+            draft = get_draft(context)
+            draft.is_anonymous = True
+            draft.display_username = "Anon"
             return await create_post(update, context)
         else:
             # Пользователь снова выбрал не анонимно
@@ -582,9 +1570,11 @@ async def handle_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return WAITING_USERNAME
 
     # Проверяем валидность username
-    if is_valid_username(user_input):
-        context.user_data['is_anonymous'] = False
-        context.user_data['display_username'] = user_input
+    username = input_classifier.classify_username(user_input)
+    if username:
+        draft = get_draft(context)
+        draft.is_anonymous = False
+        draft.display_username = username
         return await create_post(update, context)
     else:
         await update.message.reply_text(
@@ -595,90 +1585,314 @@ async def handle_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def create_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Создание поста (общая функция)"""
+    tenant = get_tenant()
+    db = tenant.db
     user = update.effective_user
-    user_data = context.user_data
+    draft = get_draft(context)
+
+    if draft.photo_id is None or draft.age is None or draft.country is None:
+        # Черновик уже удален очисткой - не создаем пустой пост
+        await update.message.reply_text(
+            get_text('draft_expired', user.id),
+            reply_markup=ReplyKeyboardRemove()
+        )
+        return ConversationHandler.END
 
     try:
-        # Проверяем, есть ли уже тема для пользователя
-        existing_topic_id = db.get_user_topic(user.id)
-
-        if existing_topic_id:
-            # Используем существующую тему
-            topic_id = existing_topic_id
-            # Отправляем разделитель для нового поста
-            await context.bot.send_message(
-                chat_id=MODERATOR_GROUP_ID,
-                message_thread_id=topic_id,
-                text=f"🆕 New submission from {user.first_name} ({user.id})"
+        # Пост и отправка его модераторам фиксируются одной транзакцией,
+        # сами сообщения в группу доставляет обработчик outbox
+        with db.transaction():
+            post_id = db.create_post(
+                user_id=user.id,
+                photo_id=draft.photo_id,
+                age=draft.age,
+                country=draft.country,
+                country_emoji=draft.country_emoji,
+                is_anonymous=draft.is_anonymous,
+                display_username=draft.display_username,
+                mod_chat_id=tenant.moderator_group_id,
+                mod_message_id=None
             )
-        else:
-            # Создаем новую тему
-            topic_name = f"{user.first_name} ({user.id})"
-            topic = await context.bot.create_forum_topic(
-                chat_id=MODERATOR_GROUP_ID,
-                name=topic_name
+            db.enqueue_outbox(
+                'moderation_post',
+                {'post_id': post_id, 'user_id': user.id, 'first_name': user.first_name},
+                f"moderation_post:{post_id}"
             )
-            topic_id = topic.message_thread_id
-            db.set_user_topic(user.id, topic_id)
-
-        # Формируем текст поста
-        post_text = format_post_text(
-            user_data['country_emoji'],
-            user_data['display_username'],
-            user_data['age']
+
+        await update.message.reply_text(
+            get_text('submitted', user.id),
+            reply_markup=ReplyKeyboardRemove()
+        )
+
+    except Exception as e:
+        logging.error(f"Error creating post: {e}")
+        await update.message.reply_text(
+            get_text('error', user.id)
         )
 
-        # Отправляем фото в тему с временными кнопками
-        message = await context.bot.send_photo(
-            chat_id=MODERATOR_GROUP_ID,
+    # Очищаем черновик пользователя
+    draft.clear()
+    return ConversationHandler.END
+
+# ========== OUTBOX ==========
+# Действия доставляются как минимум один раз, поэтому каждое из них
+# перед отправкой проверяет, не было ли оно уже выполнено
+async def deliver_moderation_post(bot, payload: Dict):
+    """Отправка поста в тему пользователя в группе модераторов"""
+    db = get_db()
+    post_id = payload['post_id']
+    post = db.get_post(post_id)
+    user_id = post['user_id']
+
+    # Проверяем, есть ли уже тема для пользователя
+    topic_id = db.get_user_topic(user_id)
+
+    if not topic_id:
+        # Создаем новую тему
+        topic = await bot.create_forum_topic(
+            chat_id=post['mod_chat_id'],
+            name=f"{payload['first_name']} ({user_id})"
+        )
+        topic_id = topic.message_thread_id
+        db.set_user_topic(user_id, topic_id)
+    elif post['mod_message_id'] is None and not get_tenant().digest_mode:
+        # Отправляем разделитель для нового поста (в режиме дайджеста он пришел бы уже после поста,
+        # поэтому не отправляем его вовсе)
+        await notify_moderators(
+            bot,
+            topic_id,
+            f"🆕 New submission from {payload['first_name']} ({user_id})"
+        )
+
+    if post['mod_message_id'] is None:
+        # Отправляем фото в тему
+        message = await bot.send_photo(
+            chat_id=post['mod_chat_id'],
             message_thread_id=topic_id,
-            photo=user_data['photo_id'],
-            caption=post_text,
+            photo=post['photo_id'],
+            caption=format_post_text(post['country_emoji'], post['display_username'], post['age']),
             parse_mode='HTML'
         )
+        db.update_post_status(post_id, 'pending', message.message_id)
+
+    # Отправляем кнопки модерации как отдельное сообщение
+    button_message = await bot.send_message(
+        chat_id=post['mod_chat_id'],
+        message_thread_id=topic_id,
+        text=f"Post #{post_id} - Moderation",
+        reply_markup=get_moderation_keyboard(post_id)
+    )
 
-        # Создаем пост в базе данных с ID сообщения
-        post_id = db.create_post(
-            user_id=user.id,
-            photo_id=user_data['photo_id'],
-            age=user_data['age'],
-            country=user_data['country'],
-            country_emoji=user_data['country_emoji'],
-            is_anonymous=user_data.get('is_anonymous', True),
-            display_username=user_data['display_username'],
-            mod_chat_id=MODERATOR_GROUP_ID,
-            mod_message_id=message.message_id
+    # Сохраняем ID сообщения с кнопками
+    db.update_post_status(post_id, 'pending', button_message.message_id)
+
+async def deliver_publish(bot, payload: Dict):
+    """Публикация поста в один канал"""
+    db = get_db()
+    post_id = payload['post_id']
+    channel_id = payload['channel_id']
+    channels = {c['channel_id']: c for c in db.get_post_channels(post_id)}
+
+    if channels[channel_id]['status'] != 'published':
+        post = db.get_post(post_id)
+        message = await bot.send_photo(
+            chat_id=channel_id,
+            photo=post['photo_id'],
+            caption=format_post_text(post['country_emoji'], post['display_username'], post['age']),
+            parse_mode='HTML'
         )
+        db.set_post_channel_published(post_id, channel_id, message.message_id)
 
-        # Отправляем кнопки модерации как отдельное сообщение
-        button_message = await context.bot.send_message(
-            chat_id=MODERATOR_GROUP_ID,
-            message_thread_id=topic_id,
-            text=f"Post #{post_id} - Moderation",
-            reply_markup=get_moderation_keyboard(post_id)
+    finish_publication(post_id)
+
+def finish_publication(post_id: int):
+    """Когда пост опубликован во всех каналах - меняем статус и ставим уведомления"""
+    db = get_db()
+    post = db.get_post(post_id)
+    channels = db.get_post_channels(post_id)
+    if post['status'] == 'published' or any(c['status'] != 'published' for c in channels):
+        return
+
+    with db.transaction():
+        db.update_post_status(post_id, 'published')
+        db.enqueue_outbox(
+            'moderation_edit',
+            {'post_id': post_id, 'text': f"✅ Post #{post_id} published in channel"},
+            f"moderation_edit:{post_id}:published"
+        )
+        db.enqueue_outbox(
+            'moderator_note',
+            {'user_id': post['user_id'], 'text': f"✅ Post #{post_id} published in channel: {', '.join(c['channel_id'] for c in channels)}"},
+            f"moderator_note:{post_id}:published"
+        )
+        db.enqueue_outbox(
+            'notify_user',
+            {'user_id': post['user_id'], 'text_key': 'post_approved'},
+            f"notify_user:{post_id}:post_approved"
         )
 
-        # Сохраняем ID сообщения с кнопками
-        db.update_post_status(post_id, 'pending', button_message.message_id)
+def handle_publish_dead(payload: Dict, error: str):
+    """Канал так и не принял пост - показываем модераторам кнопку повтора"""
+    db = get_db()
+    post_id = payload['post_id']
+
+    with db.transaction():
+        db.set_post_channel_failed(post_id, payload['channel_id'], error)
+        db.update_post_status(post_id, 'partial')
+
+        channels = db.get_post_channels(post_id)
+        published = [c['channel_id'] for c in channels if c['status'] == 'published']
+        failed = [c['channel_id'] for c in channels if c['status'] == 'failed']
+        db.enqueue_outbox(
+            'moderation_edit',
+            {
+                'post_id': post_id,
+                'text': (
+                    f"⚠️ Post #{post_id} published in {len(published)} of {len(channels)} channels\n"
+                    f"Failed: {', '.join(failed)}"
+                ),
+                'retry': True
+            }
+        )
 
-        await update.message.reply_text(
-            get_text('submitted', user.id),
-            reply_markup=ReplyKeyboardRemove()
+def handle_moderation_post_dead(payload: Dict, error: str):
+    """Пост не дошел до модераторов - пробуем еще раз в новой теме, иначе сообщаем автору"""
+    db = get_db()
+    post_id = payload['post_id']
+    post = db.get_post(post_id)
+
+    with db.transaction():
+        # Тему могли удалить: с сохраненным topic_id падали бы и все следующие посты пользователя
+        db.set_user_topic(post['user_id'], None)
+        if not payload.get('new_topic'):
+            db.enqueue_outbox(
+                'moderation_post',
+                {**payload, 'new_topic': True},
+                f"moderation_post:{post_id}:new_topic"
+            )
+        else:
+            db.update_post_status(post_id, 'failed')
+            db.enqueue_outbox(
+                'notify_user',
+                {'user_id': post['user_id'], 'text_key': 'error'},
+                f"notify_user:{post_id}:error"
+            )
+
+async def deliver_moderation_edit(bot, payload: Dict):
+    """Обновление сообщения с кнопками модерации"""
+    db = get_db()
+    post_id = payload['post_id']
+    post = db.get_post(post_id)
+
+    try:
+        await bot.edit_message_text(
+            chat_id=post['mod_chat_id'],
+            message_id=post['mod_message_id'],
+            text=payload['text'],
+            reply_markup=get_retry_keyboard(post_id) if payload.get('retry') else None
         )
+    except BadRequest as e:
+        # Повторная доставка того же текста - не ошибка
+        if 'not modified' not in str(e).lower():
+            raise
+
+async def deliver_moderator_note(bot, payload: Dict):
+    """Информационное сообщение в тему пользователя (в режиме дайджеста их отправляет ModeratorDigest)"""
+    await notify_moderators(bot, get_db().get_user_topic(payload['user_id']), payload['text'])
+
+async def deliver_user_notification(bot, payload: Dict):
+    """Уведомление пользователя на его языке"""
+    user_lang = get_user_language(payload['user_id'])
+    await bot.send_message(
+        chat_id=payload['user_id'],
+        text=LOCALIZATION[user_lang][payload['text_key']]
+    )
+
+OUTBOX_ACTIONS = {
+    'moderation_post': deliver_moderation_post,
+    'publish': deliver_publish,
+    'moderation_edit': deliver_moderation_edit,
+    'moderator_note': deliver_moderator_note,
+    'notify_user': deliver_user_notification,
+}
+
+# Что делать, когда действие исчерпало попытки
+OUTBOX_DEAD_HANDLERS = {
+    'moderation_post': handle_moderation_post_dead,
+    'publish': handle_publish_dead,
+}
+
+# Ошибки, которые не исправятся повтором: бот заблокирован, тема или сообщение удалены
+OUTBOX_PERMANENT_ERRORS = (Forbidden, BadRequest)
 
+def get_outbox_delay(attempts: int) -> float:
+    """Экспоненциальная задержка перед следующей попыткой"""
+    return min(OUTBOX_BASE_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_DELAY)
+
+async def deliver_outbox_entry(bot, entry: Dict):
+    db = get_db()
+    payload = json.loads(entry['payload'])
+    try:
+        await OUTBOX_ACTIONS[entry['action']](bot, payload)
     except Exception as e:
-        logging.error(f"Error creating post: {e}")
-        await update.message.reply_text(
-            get_text('error', user.id)
-        )
+        attempts = entry['attempts'] + 1
+        delay = e.retry_after if isinstance(e, RetryAfter) else get_outbox_delay(attempts)
+        dead = attempts >= OUTBOX_MAX_ATTEMPTS or isinstance(e, OUTBOX_PERMANENT_ERRORS)
+        logging.error(f"Outbox {entry['action']} #{entry['outbox_id']} failed (attempt {attempts}): {e}")
+
+        db.fail_outbox(entry['outbox_id'], attempts, datetime.now() + timedelta(seconds=delay), str(e), dead)
+        if dead and entry['action'] in OUTBOX_DEAD_HANDLERS:
+            OUTBOX_DEAD_HANDLERS[entry['action']](payload, str(e))
+    else:
+        db.complete_outbox(entry['outbox_id'])
 
-    # Очищаем данные пользователя
-    context.user_data.clear()
-    return ConversationHandler.END
+async def process_outbox(bot):
+    """Доставляет все созревшие действия с ограничением параллельности"""
+    tenant = get_tenant()
+    if tenant.outbox_lock.locked():
+        return
+
+    async with tenant.outbox_lock:
+        semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+
+        async def deliver_in_order(entries: List[Dict]):
+            for entry in entries:
+                async with semaphore:
+                    await deliver_outbox_entry(bot, entry)
+
+        # В режиме дайджеста заметки для модераторов отправляет ModeratorDigest
+        exclude_actions = ('moderator_note',) if tenant.digest_mode else ()
+
+        while True:
+            entries = tenant.db.get_due_outbox(OUTBOX_BATCH_SIZE, exclude_actions)
+            if not entries:
+                break
+
+            # Действия одного пользователя выполняются по очереди: иначе два поста
+            # нового пользователя одновременно создали бы две темы
+            queues: Dict[object, List[Dict]] = {}
+            for entry in entries:
+                user_id = json.loads(entry['payload']).get('user_id')
+                key = ('user', user_id) if user_id is not None else ('entry', entry['outbox_id'])
+                queues.setdefault(key, []).append(entry)
+            await asyncio.gather(*(deliver_in_order(queue) for queue in queues.values()))
+
+async def outbox_worker_job(context: ContextTypes.DEFAULT_TYPE):
+    """Периодический запуск обработчика outbox"""
+    bind_job_tenant(context)
+    await process_outbox(context.bot)
+
+async def prune_outbox_job(context: ContextTypes.DEFAULT_TYPE):
+    """Удаление давно доставленных действий, чтобы таблица не росла бесконечно"""
+    removed = context.bot_data['tenant'].db.prune_outbox(datetime.now() - timedelta(days=OUTBOX_RETENTION_DAYS))
+    if removed:
+        logging.info(f"Pruned {removed} delivered outbox entries")
 
 # ========== МОДЕРАЦИЯ ==========
 async def handle_moderation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка нажатия кнопок модерации"""
+    tenant = get_tenant()
+    db = tenant.db
     query = update.callback_query
     await query.answer()
 
@@ -692,98 +1906,86 @@ async def handle_moderation_callback(update: Update, context: ContextTypes.DEFAU
         return
 
     if action == 'approve':
-        # Публикация в канал
-        try:
-            # Формируем финальный пост
-            post_text = format_post_text(
-                post['country_emoji'],
-                post['display_username'],
-                post['age']
-            )
-
-            # Публикуем в канал
-            channel_message = await context.bot.send_photo(
-                chat_id=CHANNEL_ID,
-                photo=post['photo_id'],
-                caption=post_text,
-                parse_mode='HTML'
-            )
-
-            # Обновляем статус поста
-            db.update_post_status(post_id, 'published', channel_message.message_id)
+        # Повторное нажатие во время публикации или после неё
+        if post['status'] not in ('pending', 'partial'):
+            return
+
+        # Ставим публикацию во все ещё не опубликованные каналы
+        user_lang = db.get_user_language(post['user_id'])
+        with db.transaction():
+            db.add_post_channels(post_id, tenant.channel_router.get_targets(post, user_lang))
+            for channel in db.get_post_channels(post_id):
+                if channel['status'] != 'published':
+                    db.enqueue_outbox(
+                        'publish',
+                        {'post_id': post_id, 'channel_id': channel['channel_id']},
+                        f"publish:{post_id}:{channel['channel_id']}"
+                    )
+            db.update_post_status(post_id, 'approved')
 
-            # Убираем кнопки из сообщения модерации
-            await query.edit_message_reply_markup(reply_markup=None)
-
-            # Обновляем текст сообщения с кнопками
+        try:
             await query.edit_message_text(
-                text=f"✅ Post #{post_id} published in channel",
+                text=f"⏳ Post #{post_id} approved, publishing...",
                 reply_markup=None
             )
-
-            # Добавляем отметку о публикации
-            await context.bot.send_message(
-                chat_id=MODERATOR_GROUP_ID,
-                message_thread_id=db.get_user_topic(post['user_id']),
-                text=f"✅ Published in channel: {CHANNEL_ID}"
-            )
-
-            # Уведомляем пользователя
-            try:
-                user_lang = db.get_user_language(post['user_id'])
-                approval_text = LOCALIZATION[user_lang]['post_approved']
-                await context.bot.send_message(
-                    chat_id=post['user_id'],
-                    text=approval_text
-                )
-            except Exception as e:
-                logging.error(f"Could not notify user: {e}")
-
         except Exception as e:
-            logging.error(f"Error publishing post: {e}")
-            await query.message.reply_text(f"❌ Error: {str(e)}")
+            logging.error(f"Could not update moderation message: {e}")
 
     elif action == 'reject':
-        # Отклонение поста
-        db.update_post_status(post_id, 'rejected')
-
-        # Убираем кнопки из сообщения модерации
-        await query.edit_message_reply_markup(reply_markup=None)
+        if post['status'] != 'pending':
+            return
 
-        # Обновляем текст сообщения с кнопками
-        await query.edit_message_text(
-            text=f"❌ Post #{post_id} rejected",
-            reply_markup=None
-        )
-
-        # Добавляем отметку об отклонении
-        await context.bot.send_message(
-            chat_id=MODERATOR_GROUP_ID,
-            message_thread_id=db.get_user_topic(post['user_id']),
-            text=f"❌ Post #{post_id} rejected by moderator"
-        )
+        # Отклонение поста
+        with db.transaction():
+            db.update_post_status(post_id, 'rejected')
+            db.enqueue_outbox(
+                'moderator_note',
+                {'user_id': post['user_id'], 'text': f"❌ Post #{post_id} rejected by moderator"},
+                f"moderator_note:{post_id}:rejected"
+            )
+            db.enqueue_outbox(
+                'notify_user',
+                {'user_id': post['user_id'], 'text_key': 'post_rejected'},
+                f"notify_user:{post_id}:post_rejected"
+            )
 
-        # Уведомляем пользователя
         try:
-            user_lang = db.get_user_language(post['user_id'])
-            rejection_text = LOCALIZATION[user_lang]['post_rejected']
-            await context.bot.send_message(
-                chat_id=post['user_id'],
-                text=rejection_text
+            await query.edit_message_text(
+                text=f"❌ Post #{post_id} rejected",
+                reply_markup=None
             )
         except Exception as e:
-            logging.error(f"Could not notify user: {e}")
+            logging.error(f"Could not update moderation message: {e}")
 
 # ========== ГЛАВНАЯ ФУНКЦИЯ ==========
-def main():
-    """Запуск бота"""
-    logging.basicConfig(
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        level=logging.INFO
+def build_application(tenant: Tenant) -> Application:
+    """Приложение бота одного сообщества"""
+    application = (
+        Application.builder()
+        .token(tenant.bot_token)
+        .context_types(ContextTypes(user_data=Draft))
+        .post_stop(on_application_stop)
+        .build()
     )
+    application.bot_data['tenant'] = tenant
 
-    # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Каждое обновление обрабатывается в контексте своего сообщества
+    application.add_handler(TypeHandler(Update, bind_tenant), group=-2)
+    application.add_handler(TypeHandler(Update, touch_draft), group=-1)
+
+    # Периодический сброс дайджеста для группы модераторов
+    if tenant.digest_mode:
+        application.job_queue.run_repeating(flush_digest_job, interval=tenant.digest_interval, first=tenant.digest_interval)
+
+    # Фоновая доставка исходящих действий
+    application.job_queue.run_repeating(outbox_worker_job, interval=OUTBOX_POLL_INTERVAL, first=OUTBOX_POLL_INTERVAL)
+    application.job_queue.run_repeating(prune_outbox_job, interval=OUTBOX_PRUNE_INTERVAL, first=OUTBOX_PRUNE_INTERVAL)
+
+    # Очистка брошенных черновиков
+    application.job_queue.run_repeating(cleanup_drafts_job, interval=DRAFT_CLEANUP_INTERVAL, first=DRAFT_CLEANUP_INTERVAL)
+
+    # Продолжение прерванных рассылок после запуска
+    application.job_queue.run_once(resume_broadcasts_job, when=1)
 
     # Создаем ConversationHandler
     conv_handler = ConversationHandler(
@@ -817,9 +2019,13 @@ def main():
                 CommandHandler('cancel', cancel_command),
                 CommandHandler('language', language_command)
             ],
+            ConversationHandler.TIMEOUT: [
+                TypeHandler(Update, conversation_timeout)
+            ],
         },
         fallbacks=[CommandHandler('cancel', cancel_command)],
-        per_message=False
+        per_message=False,
+        conversation_timeout=CONVERSATION_TIMEOUT
     )
 
     # Добавляем обработчики
@@ -829,9 +2035,68 @@ def main():
     application.add_handler(CallbackQueryHandler(handle_moderation_callback, pattern='^(approve|reject)_'))
     application.add_handler(CommandHandler('language', language_command))
 
+    # Поиск и рассылка доступны только в группе модераторов
+    moderators_filter = filters.Chat(chat_id=tenant.moderator_group_id)
+    application.add_handler(CommandHandler('search', search_command, filters=moderators_filter))
+    application.add_handler(CommandHandler('broadcast', broadcast_command, filters=moderators_filter))
+    application.add_handler(CallbackQueryHandler(search_page_callback, pattern='^search_'))
+
+    return application
+
+async def run_applications(applications: List[Application]):
+    """Запуск нескольких ботов на одном event loop до SIGINT/SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # На Windows у event loop нет add_signal_handler
+            signal.signal(sig, lambda *args: loop.call_soon_threadsafe(stop_event.set))
+
+    started = []
+    try:
+        for application in applications:
+            await application.initialize()
+            started.append(application)
+            if application.post_init:
+                await application.post_init(application)
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await application.start()
+
+        await stop_event.wait()
+    finally:
+        for application in reversed(started):
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+def main():
+    """Запуск бота"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    # Общие для всех сообществ: справочник стран, разбор ввода и локализация
+    applications = [build_application(tenant) for tenant in load_tenants()]
+
     # Запускаем бота
     print("Bot is running...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if len(applications) == 1:
+        applications[0].run_polling(allowed_updates=Update.ALL_TYPES)
+    else:
+        logging.info(f"Running {len(applications)} tenants in one process")
+        try:
+            asyncio.run(run_applications(applications))
+        except KeyboardInterrupt:
+            pass
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+GROUP_ID = -1001234567890
+CHANNEL_ID = '@test_channel'
+
+
+class FakeBot:
+    """Записывает вызовы Telegram API вместо отправки"""
+
+    def __init__(self):
+        self.calls = []
+        self.next_message_id = 1
+        self.next_thread_id = 1
+
+    def _message(self):
+        message = SimpleNamespace(message_id=self.next_message_id)
+        self.next_message_id += 1
+        return message
+
+    async def send_message(self, chat_id, text, message_thread_id=None, reply_markup=None, **kwargs):
+        self.calls.append(('send_message', chat_id, text))
+        return self._message()
+
+    async def send_photo(self, chat_id, photo, caption=None, message_thread_id=None, parse_mode=None, **kwargs):
+        self.calls.append(('send_photo', chat_id, caption))
+        return self._message()
+
+    async def create_forum_topic(self, chat_id, name, **kwargs):
+        self.calls.append(('create_forum_topic', chat_id, name))
+        topic = SimpleNamespace(message_thread_id=self.next_thread_id)
+        self.next_thread_id += 1
+        return topic
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self.calls.append(('edit_message_text', chat_id, text))
+        return True
+
+    def count(self, method, chat_id=None):
+        return sum(
+            1 for call in self.calls
+            if call[0] == method and (chat_id is None or call[1] == chat_id)
+        )
+
+
+class FakeMessage:
+    def __init__(self, text=None):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return SimpleNamespace(message_id=0)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        pass
+
+
+@pytest.fixture
+def tenant(tmp_path):
+    """Сообщество с временной базой, привязанное к текущему контексту"""
+    tenant = bot.Tenant('test', 'token', GROUP_ID, CHANNEL_ID, db_name=str(tmp_path / 'bot.db'))
+    token = bot.current_tenant.set(tenant)
+    yield tenant
+    bot.current_tenant.reset(token)
+    tenant.db.conn.close()
+
+
+def make_user(user_id, username=None):
+    return SimpleNamespace(id=user_id, first_name=f"User{user_id}", username=username, full_name=f"User {user_id}")
+
+
+async def submit_post(fake_bot, user_id):
+    """Проходит создание поста так, как это делает ConversationHandler"""
+    user = make_user(user_id)
+    # Пользователь уже прошел /start
+    bot.get_db().add_user(user.id, user.username, user.full_name)
+    draft = bot.Draft()
+    draft.photo_id = f"photo-{user_id}"
+    draft.age = 25
+    draft.country = 'Russia'
+    draft.country_emoji = '🇷🇺'
+    draft.display_username = 'Anon'
+    update = SimpleNamespace(effective_user=user, message=FakeMessage())
+    context = SimpleNamespace(bot=fake_bot, user_data=draft)
+    await bot.create_post(update, context)
+
+
+async def moderate_post(fake_bot, post_id, action):
+    update = SimpleNamespace(callback_query=FakeCallbackQuery(f"{action}_{post_id}"))
+    context = SimpleNamespace(bot=fake_bot)
+    await bot.handle_moderation_callback(update, context)
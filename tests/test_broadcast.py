@@ -0,0 +1,200 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import bot
+from conftest import GROUP_ID, FakeBot
+
+USERS = 20
+
+
+class FailingBot(FakeBot):
+    """Падает на отправке выбранным пользователям"""
+
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = errors
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+class HangingBot(FakeBot):
+    """Отправка никогда не завершается"""
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.Event().wait()
+
+
+@pytest.fixture
+def users(tenant):
+    tenant.broadcast_limiter = bot.RateLimiter(10_000)
+    for user_id in range(1, USERS + 1):
+        tenant.db.add_user(user_id, None, f"User {user_id}")
+
+
+def test_unexpected_error_fails_only_its_recipient(tenant, users):
+    fake_bot = FailingBot({3: TelegramError('Unexpected'), 7: ValueError('Bad payload')})
+    broadcast_id = tenant.db.create_broadcast({'en': 'Hello'})
+
+    asyncio.run(bot.run_broadcast(fake_bot, broadcast_id))
+
+    broadcast = tenant.db.get_broadcast(broadcast_id)
+    assert (broadcast['status'], broadcast['sent'], broadcast['failed']) == ('done', USERS - 2, 2)
+    assert fake_bot.count('send_message', GROUP_ID) == 1
+
+
+def test_broadcasts_share_tenant_rate_limiter(tenant, users):
+    waits = []
+    limiter_wait = tenant.broadcast_limiter.wait
+
+    async def wait():
+        waits.append(1)
+        await limiter_wait()
+
+    tenant.broadcast_limiter.wait = wait
+    fake_bot = FakeBot()
+
+    async def scenario():
+        first = tenant.db.create_broadcast({'en': 'First'})
+        second = tenant.db.create_broadcast({'en': 'Second'})
+        await asyncio.gather(bot.run_broadcast(fake_bot, first), bot.run_broadcast(fake_bot, second))
+
+    asyncio.run(scenario())
+    assert len(waits) == USERS * 2
+
+
+def test_stop_cancels_broadcast_and_keeps_it_resumable(tenant, users):
+    broadcast_id = tenant.db.create_broadcast({'en': 'Hello'})
+
+    async def scenario():
+        bot.start_broadcast(HangingBot(), broadcast_id)
+        # Повторный запуск той же рассылки игнорируется
+        bot.start_broadcast(HangingBot(), broadcast_id)
+        assert len(tenant.broadcast_tasks) == 1
+        await asyncio.sleep(0)
+
+        await asyncio.wait_for(bot.stop_broadcasts(tenant), timeout=1)
+
+    asyncio.run(scenario())
+    assert tenant.broadcast_tasks == {}
+    assert tenant.db.get_running_broadcast_ids() == [broadcast_id]
+    assert tenant.db.get_broadcast(broadcast_id)['cursor_user_id'] == 0
+
+
+def get_active_user_ids(tenant):
+    return [row[0] for row in tenant.db.conn.execute('SELECT user_id FROM users WHERE is_active = 1 ORDER BY user_id')]
+
+
+def test_blocked_recipients_are_deactivated(tenant, users):
+    fake_bot = FailingBot({
+        2: Forbidden('Forbidden: bot was blocked by the user'),
+        4: BadRequest('Chat not found'),
+        6: BadRequest('Message is too long'),
+    })
+    broadcast_id = tenant.db.create_broadcast({'en': 'Hello'})
+    next_bot = FakeBot()
+
+    async def scenario():
+        await bot.run_broadcast(fake_bot, broadcast_id)
+        # Следующая рассылка обходит заблокировавших
+        await bot.run_broadcast(next_bot, tenant.db.create_broadcast({'en': 'Again'}))
+
+    asyncio.run(scenario())
+
+    broadcast = tenant.db.get_broadcast(broadcast_id)
+    assert (broadcast['sent'], broadcast['blocked'], broadcast['failed']) == (USERS - 3, 2, 1)
+    # Прочие ошибки BadRequest не значат, что пользователь недоступен
+    assert get_active_user_ids(tenant) == [user_id for user_id in range(1, USERS + 1) if user_id not in (2, 4)]
+    # Сообщения всем активным и итог в группу модераторов
+    assert next_bot.count('send_message') == USERS - 2 + 1
+
+
+class FloodBot(FakeBot):
+    """Telegram один раз просит подождать на сообщении пользователю flood_user_id"""
+
+    def __init__(self, flood_user_id):
+        super().__init__()
+        self.flood_user_id = flood_user_id
+        self.attempts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.attempts.append(chat_id)
+        if chat_id == self.flood_user_id and self.attempts.count(chat_id) == 1:
+            raise RetryAfter(3)
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+def test_retry_after_pauses_shared_limiter_and_retries(tenant, users):
+    pauses = []
+    limiter = tenant.broadcast_limiter
+    limiter_pause = limiter.pause
+
+    def pause(seconds):
+        pauses.append(seconds)
+        limiter_pause(0.01)
+
+    limiter.pause = pause
+    fake_bot = FloodBot(5)
+    broadcast_id = tenant.db.create_broadcast({'en': 'Hello'})
+
+    asyncio.run(bot.run_broadcast(fake_bot, broadcast_id))
+
+    assert pauses == [3]
+    assert fake_bot.attempts.count(5) == 2
+    broadcast = tenant.db.get_broadcast(broadcast_id)
+    assert (broadcast['sent'], broadcast['failed']) == (USERS, 0)
+
+
+class StoppingBot(FakeBot):
+    """Зависает на сообщении пользователю stop_user_id, как при остановке бота посреди порции"""
+
+    def __init__(self, stop_user_id):
+        super().__init__()
+        self.stop_user_id = stop_user_id
+        self.stopped = asyncio.Event()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == self.stop_user_id:
+            self.stopped.set()
+            await asyncio.Event().wait()
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+def test_broadcast_resumes_from_saved_cursor(tenant, users, monkeypatch):
+    monkeypatch.setattr(bot, 'BROADCAST_BATCH_SIZE', 5)
+    broadcast_id = tenant.db.create_broadcast({'en': 'Hello'})
+    first_bot = StoppingBot(12)
+
+    async def interrupted_run():
+        bot.start_broadcast(first_bot, broadcast_id)
+        await first_bot.stopped.wait()
+        await bot.stop_broadcasts(tenant)
+
+    asyncio.run(interrupted_run())
+    assert tenant.db.get_broadcast(broadcast_id)['cursor_user_id'] == 10
+
+    # После перезапуска resume_broadcasts_job продолжает с сохраненной позиции.
+    # Новый процесс - новое сообщество со своим ограничителем на новом event loop
+    tenant.broadcast_limiter = bot.RateLimiter(10_000)
+    second_bot = FakeBot()
+    context = SimpleNamespace(bot=second_bot, bot_data={'tenant': tenant})
+
+    async def resumed_run():
+        await bot.resume_broadcasts_job(context)
+        await asyncio.gather(*tenant.broadcast_tasks.values())
+
+    asyncio.run(resumed_run())
+
+    first_sent = {call[1] for call in first_bot.calls}
+    second_sent = [call[1] for call in second_bot.calls if call[1] != GROUP_ID]
+    # Завершенные порции не отправляются повторно, незавершенная - отправляется целиком
+    assert set(range(1, 11)) <= first_sent
+    assert second_sent == list(range(11, USERS + 1))
+    broadcast = tenant.db.get_broadcast(broadcast_id)
+    assert broadcast['status'] == 'done'
+    assert broadcast['sent'] == USERS
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest
+
+import bot
+from conftest import FakeBot, moderate_post, submit_post
+
+ROUTES = 'lang:ru=@ru_channel,@main;country:ua=@ua_channel;country:Germany=@de_channel,@main;*=@main'
+
+
+@pytest.mark.parametrize('lang, country_emoji, expected', [
+    ('ru', '🇷🇺', ['@ru_channel', '@main']),
+    ('en', '🇺🇦', ['@ua_channel']),
+    ('ru', '🇺🇦', ['@ru_channel', '@main', '@ua_channel']),
+    # @main из языка и из страны публикуется один раз
+    ('ru', '🇩🇪', ['@ru_channel', '@main', '@de_channel']),
+    ('en', '🇫🇷', ['@main']),
+])
+def test_routes_by_language_and_country(lang, country_emoji, expected):
+    router = bot.ChannelRouter(ROUTES, '@default')
+    assert router.get_targets({'country_emoji': country_emoji}, lang) == expected
+
+
+@pytest.mark.parametrize('routes', ['', ' ; ', 'lang:ru=', 'country:atlantis=@x', 'region:eu=@x'])
+def test_invalid_or_missing_routes_fall_back_to_default_channel(routes):
+    router = bot.ChannelRouter(routes, '@default')
+    assert router.get_targets({'country_emoji': '🇷🇺'}, 'ru') == ['@default']
+
+
+def test_country_route_accepts_code_name_or_flag():
+    router = bot.ChannelRouter('country:ua=@a;country:Ukraine=@b;country:🇺🇦=@c', '@default')
+    assert router.get_targets({'country_emoji': '🇺🇦'}, 'en') == ['@a', '@b', '@c']
+
+
+def test_wildcard_routes_replace_default_channel():
+    router = bot.ChannelRouter('*=@main,@backup,@main', '@default')
+    assert router.get_targets({'country_emoji': '🇷🇺'}, 'en') == ['@main', '@backup']
+
+
+class ChannelFailingBot(FakeBot):
+    """Канал из broken не принимает посты"""
+
+    def __init__(self, broken):
+        super().__init__()
+        self.broken = set(broken)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        if chat_id in self.broken:
+            raise BadRequest('Chat not found')
+        return await super().send_photo(chat_id, photo, **kwargs)
+
+
+def test_failed_channel_is_retried_alone(tenant, monkeypatch):
+    tenant.digest_mode = False
+    tenant.channel_router = bot.ChannelRouter('*=@main,@broken', '@default')
+    fake_bot = ChannelFailingBot(['@broken'])
+
+    async def scenario():
+        await submit_post(fake_bot, 1)
+        await bot.process_outbox(fake_bot)
+        await moderate_post(fake_bot, 1, 'approve')
+        await bot.process_outbox(fake_bot)
+
+    asyncio.run(scenario())
+
+    assert tenant.db.get_post(1)['status'] == 'partial'
+    channels = {c['channel_id']: c['status'] for c in tenant.db.get_post_channels(1)}
+    assert channels == {'@main': 'published', '@broken': 'failed'}
+    assert any('published in 1 of 2 channels' in call[2] for call in fake_bot.calls if call[0] == 'edit_message_text')
+
+    # Канал починили, модератор нажал «Повторить»
+    fake_bot.broken.clear()
+
+    async def retry():
+        await moderate_post(fake_bot, 1, 'approve')
+        await bot.process_outbox(fake_bot)
+
+    asyncio.run(retry())
+
+    assert tenant.db.get_post(1)['status'] == 'published'
+    assert fake_bot.count('send_photo', '@main') == 1
+    assert fake_bot.count('send_photo', '@broken') == 1
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError
+
+import bot
+from conftest import GROUP_ID, FakeBot, moderate_post, submit_post
+
+USERS = 50
+ROUNDS = 3
+
+
+async def flush_digest(tenant, fake_bot):
+    await tenant.digest.flush(fake_bot)
+
+
+def run_load(tenant, monkeypatch, digest_mode):
+    """Каждый пользователь отправляет пост в каждом раунде, модераторы одобряют или отклоняют все посты"""
+    tenant.digest_mode = digest_mode
+    monkeypatch.setattr(bot, 'DIGEST_SEND_INTERVAL', 0)
+    fake_bot = FakeBot()
+
+    async def scenario():
+        for _ in range(ROUNDS):
+            for user_id in range(1, USERS + 1):
+                await submit_post(fake_bot, user_id)
+            await bot.process_outbox(fake_bot)
+
+            cursor = tenant.db.conn.execute("SELECT post_id FROM posts WHERE status = 'pending'")
+            for (post_id,) in cursor.fetchall():
+                await moderate_post(fake_bot, post_id, 'approve' if post_id % 2 else 'reject')
+            await bot.process_outbox(fake_bot)
+
+            # Конец окна дайджеста
+            await flush_digest(tenant, fake_bot)
+
+    asyncio.run(scenario())
+    return fake_bot
+
+
+def test_digest_reduces_group_messages_per_submission(tenant, monkeypatch):
+    submissions = USERS * ROUNDS
+
+    plain = run_load(tenant, monkeypatch, digest_mode=False)
+    plain_calls = plain.count('send_message', GROUP_ID)
+
+    tenant.db.conn.execute('DELETE FROM posts')
+    tenant.db.conn.execute('DELETE FROM outbox')
+    tenant.db.conn.execute('DELETE FROM users')
+    tenant.db.conn.commit()
+
+    digest = run_load(tenant, monkeypatch, digest_mode=True)
+    digest_calls = digest.count('send_message', GROUP_ID)
+
+    # Без дайджеста: кнопки, отметка о решении и разделитель для повторных постов
+    assert plain_calls == submissions * 2 + USERS * (ROUNDS - 1)
+    # С дайджестом: только кнопки модерации и одно сообщение на окно
+    assert digest_calls == submissions + ROUNDS
+    assert digest_calls / submissions < plain_calls / submissions / 2
+
+
+def test_digest_mode_keeps_other_deliveries(tenant, monkeypatch):
+    fake_bot = run_load(tenant, monkeypatch, digest_mode=True)
+
+    approved = (USERS * ROUNDS + 1) // 2
+    assert fake_bot.count('send_photo', GROUP_ID) == USERS * ROUNDS
+    assert fake_bot.count('send_photo', '@test_channel') == approved
+    # Каждый автор получает уведомление о решении
+    assert sum(1 for call in fake_bot.calls if call[0] == 'send_message' and call[1] > 0) == USERS * ROUNDS
+
+
+def test_long_digest_is_split_within_message_limit(tenant, monkeypatch):
+    monkeypatch.setattr(bot, 'DIGEST_SEND_INTERVAL', 0)
+    fake_bot = FakeBot()
+    for post_id in range(500):
+        tenant.db.enqueue_outbox('moderator_note', {'user_id': 1, 'text': f"❌ Post #{post_id} rejected by moderator"})
+    asyncio.run(tenant.digest.flush(fake_bot))
+
+    texts = [call[2] for call in fake_bot.calls]
+    assert 1 < len(texts) < 500
+    assert all(len(text) <= bot.MAX_MESSAGE_LENGTH for text in texts)
+    assert sum(text.count('\n') + 1 for text in texts) == 500
+    assert tenant.db.get_pending_outbox('moderator_note', 1000) == []
+
+
+class DigestFailingBot(FakeBot):
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    async def send_message(self, chat_id, text, **kwargs):
+        raise self.error
+
+
+def outbox_statuses(tenant):
+    cursor = tenant.db.conn.execute("SELECT status, attempts FROM outbox WHERE action = 'moderator_note'")
+    return cursor.fetchall()
+
+
+@pytest.mark.parametrize('error', [BadRequest('Message thread not found'), Forbidden('Bot was kicked')])
+def test_permanent_digest_error_dead_letters_notes(tenant, monkeypatch, error):
+    monkeypatch.setattr(bot, 'DIGEST_SEND_INTERVAL', 0)
+    for post_id in range(300):
+        tenant.db.enqueue_outbox('moderator_note', {'user_id': 1, 'text': f"❌ Post #{post_id} rejected by moderator"})
+
+    asyncio.run(tenant.digest.flush(DigestFailingBot(error)))
+
+    assert set(outbox_statuses(tenant)) == {('dead', 1)}
+
+
+def test_transient_digest_error_keeps_notes_until_attempts_run_out(tenant, monkeypatch):
+    monkeypatch.setattr(bot, 'OUTBOX_MAX_ATTEMPTS', 2)
+    tenant.db.enqueue_outbox('moderator_note', {'user_id': 1, 'text': "✅ Post #1 published"})
+    fake_bot = DigestFailingBot(NetworkError('Timed out'))
+
+    asyncio.run(tenant.digest.flush(fake_bot))
+    assert outbox_statuses(tenant) == [('pending', 1)]
+
+    asyncio.run(tenant.digest.flush(fake_bot))
+    assert outbox_statuses(tenant) == [('dead', 2)]
+
+
+def test_flush_reads_limited_number_of_notes(tenant, monkeypatch):
+    monkeypatch.setattr(bot, 'DIGEST_SEND_INTERVAL', 0)
+    monkeypatch.setattr(bot, 'DIGEST_MAX_LINES', 10)
+    for post_id in range(25):
+        tenant.db.enqueue_outbox('moderator_note', {'user_id': 1, 'text': f"❌ Post #{post_id} rejected by moderator"})
+
+    asyncio.run(tenant.digest.flush(FakeBot()))
+
+    assert len(tenant.db.get_pending_outbox('moderator_note', 1000)) == 15
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import bot
+from conftest import FakeBot, FakeMessage, make_user
+
+
+class FakeApplication:
+    def __init__(self):
+        self.user_data = {}
+
+    def drop_user_data(self, user_id):
+        self.user_data.pop(user_id, None)
+
+
+def make_stale(draft):
+    draft.updated_at = time.monotonic() - bot.CONVERSATION_TIMEOUT - 1
+
+
+def test_cleanup_evicts_only_stale_drafts():
+    application = FakeApplication()
+    application.user_data[1] = bot.Draft()
+    application.user_data[2] = bot.Draft()
+    make_stale(application.user_data[1])
+
+    asyncio.run(bot.cleanup_drafts_job(SimpleNamespace(application=application)))
+
+    assert list(application.user_data) == [2]
+
+
+def test_any_update_keeps_draft_alive():
+    """Неверный ввод тоже считается активностью, иначе черновик удалят посреди разговора"""
+    application = FakeApplication()
+    draft = bot.Draft()
+    make_stale(draft)
+    application.user_data[1] = draft
+
+    update = SimpleNamespace(effective_user=make_user(1))
+    asyncio.run(bot.touch_draft(update, SimpleNamespace(application=application)))
+    asyncio.run(bot.cleanup_drafts_job(SimpleNamespace(application=application)))
+
+    assert application.user_data[1] is draft
+
+
+def test_touch_does_not_create_drafts():
+    application = FakeApplication()
+    update = SimpleNamespace(effective_user=make_user(1))
+
+    asyncio.run(bot.touch_draft(update, SimpleNamespace(application=application)))
+
+    assert application.user_data == {}
+
+
+def test_create_post_rejects_evicted_draft(tenant):
+    user = make_user(1)
+    tenant.db.add_user(user.id, user.username, user.full_name)
+    update = SimpleNamespace(effective_user=user, message=FakeMessage())
+    context = SimpleNamespace(bot=FakeBot(), user_data=bot.Draft())
+
+    asyncio.run(bot.create_post(update, context))
+
+    assert tenant.db.conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0] == 0
+    assert update.message.replies == [bot.LOCALIZATION['en']['draft_expired']]
+
+
+def test_draft_has_no_instance_dict():
+    assert not hasattr(bot.Draft(), '__dict__')
+
+
+def run_timeout(tenant, application, user_id):
+    fake_bot = FakeBot()
+    update = SimpleNamespace(effective_user=make_user(user_id))
+    context = SimpleNamespace(application=application, bot=fake_bot, bot_data={'tenant': tenant})
+    asyncio.run(bot.conversation_timeout(update, context))
+    return fake_bot
+
+
+def test_timeout_notifies_only_about_started_posts(tenant):
+    application = FakeApplication()
+    application.user_data[1] = bot.Draft()
+    application.user_data[2] = bot.Draft()
+    application.user_data[2].photo_id = 'photo'
+
+    # Выбрал язык, но не прислал фото
+    assert run_timeout(tenant, application, 1).calls == []
+    assert run_timeout(tenant, application, 2).calls == [('send_message', 2, bot.LOCALIZATION['en']['draft_expired'])]
+    assert application.user_data == {}
+
+
+def test_timeout_does_not_recreate_evicted_draft(tenant):
+    application = FakeApplication()
+
+    assert run_timeout(tenant, application, 1).calls == []
+    assert application.user_data == {}
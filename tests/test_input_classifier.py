@@ -0,0 +1,122 @@
+import pytest
+
+from bot import UserInput, input_classifier
+
+
+@pytest.mark.parametrize('text, lang, expected', [
+    ('anon', 'en', True),
+    ('Anonymous', 'en', True),
+    ('  ANON  ', 'en', True),
+    ('anonymously please', 'en', True),
+    ('not anon', 'en', False),
+    ('Not   Anonymous', 'en', False),
+    ('not anonymously', 'en', False),
+    ('анон', 'en', True),
+    ('не анон', 'en', False),
+    ('анон', 'ru', True),
+    ('анонимно', 'ru', True),
+    ('не анон', 'ru', False),
+    ('не анонимно', 'ru', False),
+    ('неанон', 'ru', False),
+    ('неанонимно', 'ru', False),
+    ('not anon', 'ru', False),
+    ('anon', 'ru', True),
+    ('canon', 'en', None),
+    ('anonx', 'en', None),
+    ('@anonymous_guy', 'en', None),
+    ('ананас', 'ru', None),
+    ('hello', 'en', None),
+    ('', 'en', None),
+    ('anon', 'de', True),
+])
+def test_classify_anon(text, lang, expected):
+    assert input_classifier.classify_anon(UserInput(text), lang) is expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('18', (18, None)),
+    ('100', (100, None)),
+    (' 25 ', (25, None)),
+    ('17', (None, 'age_limits')),
+    ('101', (None, 'age_limits')),
+    ('0', (None, 'age_limits')),
+    ('1000', (None, 'invalid_age')),
+    ('abc', (None, 'invalid_age')),
+    ('25 years', (None, 'invalid_age')),
+    ('-25', (None, 'invalid_age')),
+    ('2.5', (None, 'invalid_age')),
+    ('', (None, 'invalid_age')),
+    # Цифры не из ASCII: isdigit() их пропускал, а int() падал или принимал
+    ('²⁵', (None, 'invalid_age')),
+    ('٢٥', (None, 'invalid_age')),
+    ('２５', (None, 'invalid_age')),
+])
+def test_classify_age(text, expected):
+    assert input_classifier.classify_age(UserInput(text)) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('@abcde', '@abcde'),
+    ('@John_Smith', '@John_Smith'),
+    ('  @user_1  ', '@user_1'),
+    ('@' + 'a' * 32, '@' + 'a' * 32),
+    ('@john', None),
+    ('@abc', None),
+    ('@', None),
+    ('@' + 'a' * 33, None),
+    ('@1user', None),
+    ('@_user', None),
+    ('@user name', None),
+    ('@user<b>', None),
+    ('@юзернейм', None),
+    ('username', None),
+])
+def test_classify_username(text, expected):
+    assert input_classifier.classify_username(UserInput(text)) == expected
+
+
+@pytest.mark.parametrize('text, expected_emoji', [
+    ('ru', '🇷🇺'),
+    ('RU', '🇷🇺'),
+    ('Russia', '🇷🇺'),
+    ('россия', '🇷🇺'),
+    ('  United   States ', '🇺🇸'),
+    ('🇩🇪', '🇩🇪'),
+    ('🇿🇦', '🇿🇦'),
+    ('герман', '🇩🇪'),
+    ('ger', '🇩🇪'),
+    ('ukr', '🇺🇦'),
+    ('korea', '🇰🇷'),
+    ('united st', '🇺🇸'),
+    ('united k', '🇬🇧'),
+    ('швед', '🇸🇪'),
+    # Середина слова не считается: раньше первой по порядку словаря находилась случайная страна
+    ('land', None),
+    ('ain', None),
+    ('rain', None),
+    ('ermany', None),
+    ('ited states', None),
+    # Префикс нескольких стран - переспрашиваем
+    ('united', None),
+    ('uni', None),
+    ('a', None),
+    ('zz', None),
+    ('atlantis', None),
+])
+def test_classify_country(text, expected_emoji):
+    country = input_classifier.classify_country(UserInput(text))
+    assert (country['emoji'] if country else None) == expected_emoji
+
+
+def test_known_flag_resolves_to_country_name():
+    assert input_classifier.classify_country(UserInput('🇩🇪'))['name'] == 'Germany'
+
+
+def test_unknown_flag_is_kept_as_is():
+    assert input_classifier.classify_country(UserInput('🇿🇦')) == {'name': '🇿🇦', 'emoji': '🇿🇦', 'code': '??'}
+
+
+def test_user_input_is_normalized_once():
+    user_input = UserInput('  Not \t ANON  ')
+    assert user_input.raw == 'Not \t ANON'
+    assert user_input.normalized == 'not anon'
@@ -0,0 +1,166 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError
+
+import bot
+from conftest import GROUP_ID, FakeBot, submit_post
+
+
+class FailingBot(FakeBot):
+    """Бот, у которого send_message падает с заданной ошибкой"""
+
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(('send_message', chat_id, text))
+        raise self.error
+
+
+def get_entry(tenant, outbox_id=1):
+    cursor = tenant.db.conn.execute('SELECT status, attempts FROM outbox WHERE outbox_id = ?', (outbox_id,))
+    return cursor.fetchone()
+
+
+@pytest.mark.parametrize('error', [Forbidden('bot was blocked by the user'), BadRequest('Message thread not found')])
+def test_permanent_error_is_dead_lettered_immediately(tenant, error):
+    tenant.db.add_user(1, 'user', 'User')
+    tenant.db.enqueue_outbox('notify_user', {'user_id': 1, 'text_key': 'post_approved'}, 'notify_user:1')
+
+    asyncio.run(bot.process_outbox(FailingBot(error)))
+
+    assert get_entry(tenant) == ('dead', 1)
+
+
+def test_transient_error_is_retried_with_backoff(tenant):
+    tenant.db.add_user(1, 'user', 'User')
+    tenant.db.enqueue_outbox('notify_user', {'user_id': 1, 'text_key': 'post_approved'}, 'notify_user:1')
+
+    asyncio.run(bot.process_outbox(FailingBot(NetworkError('timeout'))))
+
+    assert get_entry(tenant) == ('pending', 1)
+    # Следующая попытка отложена, поэтому сейчас доставлять нечего
+    assert tenant.db.get_due_outbox(10) == []
+
+
+def test_idempotency_key_prevents_duplicates(tenant):
+    tenant.db.add_user(1, 'user', 'User')
+    for _ in range(3):
+        tenant.db.enqueue_outbox('notify_user', {'user_id': 1, 'text_key': 'post_approved'}, 'notify_user:1')
+
+    fake_bot = FakeBot()
+    asyncio.run(bot.process_outbox(fake_bot))
+
+    assert fake_bot.count('send_message', 1) == 1
+
+
+def test_prune_removes_only_old_delivered_entries(tenant):
+    for key in ('old-done', 'old-dead', 'new-done'):
+        tenant.db.enqueue_outbox('notify_user', {'user_id': 1, 'text_key': 'post_approved'}, key)
+    tenant.db.conn.execute(
+        "UPDATE outbox SET created_at = ? WHERE idempotency_key LIKE 'old-%'",
+        (datetime.now() - timedelta(days=30),)
+    )
+    tenant.db.conn.execute("UPDATE outbox SET status = 'done' WHERE idempotency_key LIKE '%-done'")
+    tenant.db.conn.execute("UPDATE outbox SET status = 'dead' WHERE idempotency_key = 'old-dead'")
+    tenant.db.conn.commit()
+
+    assert tenant.db.prune_outbox(datetime.now() - timedelta(days=7)) == 1
+    keys = [row[0] for row in tenant.db.conn.execute('SELECT idempotency_key FROM outbox ORDER BY outbox_id')]
+    assert keys == ['old-dead', 'new-done']
+
+
+def test_digest_notes_survive_until_flush_succeeds(tenant):
+    tenant.digest_mode = True
+    tenant.db.enqueue_outbox('moderator_note', {'user_id': 1, 'text': '❌ Post #1 rejected by moderator'}, 'note:1')
+
+    # Обработчик outbox не трогает заметки в режиме дайджеста
+    fake_bot = FakeBot()
+    asyncio.run(bot.process_outbox(fake_bot))
+    assert fake_bot.calls == []
+
+    # Неудачный сброс оставляет заметку в outbox
+    asyncio.run(tenant.digest.flush(FailingBot(NetworkError('timeout'))))
+    assert get_entry(tenant) == ('pending', 1)
+
+    # После перезапуска новый дайджест находит ее в базе
+    restarted_digest = bot.ModeratorDigest(tenant.db, GROUP_ID)
+    asyncio.run(restarted_digest.flush(fake_bot))
+    assert fake_bot.count('send_message', GROUP_ID) == 1
+    assert get_entry(tenant) == ('done', 1)
+
+
+class StaleTopicBot(FakeBot):
+    """Тему с stale_topic_id удалили в группе модераторов; create_forum_topic может падать"""
+
+    def __init__(self, stale_topic_id=None, topic_error=None):
+        super().__init__()
+        self.stale_topic_id = stale_topic_id
+        self.topic_error = topic_error
+
+    async def send_message(self, chat_id, text, message_thread_id=None, **kwargs):
+        if message_thread_id is not None and message_thread_id == self.stale_topic_id:
+            raise BadRequest('Message thread not found')
+        return await super().send_message(chat_id, text, message_thread_id=message_thread_id, **kwargs)
+
+    async def send_photo(self, chat_id, photo, message_thread_id=None, **kwargs):
+        if message_thread_id is not None and message_thread_id == self.stale_topic_id:
+            raise BadRequest('Message thread not found')
+        return await super().send_photo(chat_id, photo, message_thread_id=message_thread_id, **kwargs)
+
+    async def create_forum_topic(self, chat_id, name, **kwargs):
+        # Отдаем управление event loop, как настоящий запрос к API
+        await asyncio.sleep(0)
+        if self.topic_error:
+            raise self.topic_error
+        return await super().create_forum_topic(chat_id, name, **kwargs)
+
+
+def test_deleted_topic_is_recreated(tenant):
+    fake_bot = StaleTopicBot(stale_topic_id=999)
+    tenant.db.add_user(1, None, 'User 1')
+    tenant.db.set_user_topic(1, 999)
+
+    async def scenario():
+        await submit_post(fake_bot, 1)
+        await bot.process_outbox(fake_bot)
+
+    asyncio.run(scenario())
+
+    post = tenant.db.get_post(1)
+    assert post['status'] == 'pending' and post['mod_message_id'] is not None
+    assert fake_bot.count('create_forum_topic') == 1
+    assert tenant.db.get_user_topic(1) == 1
+
+
+def test_undeliverable_post_fails_and_notifies_author(tenant):
+    fake_bot = StaleTopicBot(topic_error=BadRequest('Not enough rights to create a topic'))
+
+    async def scenario():
+        await submit_post(fake_bot, 1)
+        await bot.process_outbox(fake_bot)
+
+    asyncio.run(scenario())
+
+    assert tenant.db.get_post(1)['status'] == 'failed'
+    assert tenant.db.get_user_topic(1) is None
+    assert fake_bot.calls[-1] == ('send_message', 1, bot.LOCALIZATION['en']['error'])
+
+
+def test_posts_of_one_user_share_one_topic(tenant):
+    fake_bot = StaleTopicBot()
+
+    async def scenario():
+        await submit_post(fake_bot, 5)
+        await submit_post(fake_bot, 5)
+        await submit_post(fake_bot, 6)
+        await bot.process_outbox(fake_bot)
+
+    asyncio.run(scenario())
+
+    assert fake_bot.count('create_forum_topic') == 2
+    assert fake_bot.count('send_photo', GROUP_ID) == 3
+    assert tenant.db.get_user_topic(5) == 1
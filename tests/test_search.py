@@ -0,0 +1,60 @@
+import bot
+
+
+def add_posts(db, user_id, full_name, count):
+    db.add_user(user_id, None, full_name)
+    for _ in range(count):
+        db.create_post(user_id, 'photo', 25, 'Russia', '🇷🇺', True, 'Anon', -100, 1)
+
+
+def test_search_by_user_id(tenant):
+    add_posts(tenant.db, 42, 'Ivan Petrov', 3)
+    add_posts(tenant.db, 7, 'Anna Smirnova', 1)
+
+    assert [post['user_id'] for post in tenant.db.search_posts('42')] == [42, 42, 42]
+
+
+def test_non_ascii_digits_do_not_break_search(tenant):
+    add_posts(tenant.db, 42, 'Ivan Petrov', 1)
+
+    for query in ('²', '٤٢', '４２'):
+        assert tenant.db.search_posts(query) == []
+
+
+def test_search_by_name_follows_renames(tenant):
+    add_posts(tenant.db, 42, 'Ivan Petrov', 2)
+    tenant.db.add_user(42, None, 'Ivan Sidorov')
+
+    assert len(tenant.db.search_posts('sidorov')) == 2
+    assert tenant.db.search_posts('petrov') == []
+
+
+def test_unchanged_user_does_not_reindex_posts(tenant):
+    add_posts(tenant.db, 42, 'Ivan Petrov', 50)
+
+    changes = tenant.db.conn.total_changes
+    tenant.db.add_user(42, None, 'Ivan Petrov')
+    # Только сама строка users, без перезаписи 50 строк индекса
+    assert tenant.db.conn.total_changes - changes == 1
+
+
+
+def test_prefix_search_falls_back_from_whole_words(tenant):
+    add_posts(tenant.db, 42, 'Alexander Petrov', 1)
+    add_posts(tenant.db, 7, 'Alexey Smirnov', 1)
+
+    assert [post['user_id'] for post in tenant.db.search_posts('alex')] == [7, 42]
+    assert [post['user_id'] for post in tenant.db.search_posts('alexa petr')] == [42]
+
+
+def test_slow_prefix_search_is_interrupted(tenant, monkeypatch):
+    for user_id in range(1, 51):
+        add_posts(tenant.db, user_id, f"Name{user_id}", 1)
+    monkeypatch.setattr(bot, 'SEARCH_PREFIX_TIMEOUT', 0)
+
+    # Целые слова не ограничиваются по времени
+    assert len(tenant.db.search_posts('name25')) == 1
+    assert tenant.db.search_posts('nam') is None
+
+    text, keyboard = bot.build_search_page('nam')
+    assert text.startswith('🔍 Too many words') and keyboard is None
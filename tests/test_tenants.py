@@ -0,0 +1,111 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import FakeBot, moderate_post, submit_post
+
+GROUP_A = -1001111111111
+GROUP_B = -1002222222222
+
+
+@pytest.fixture
+def tenants(tmp_path):
+    tenants = [
+        bot.Tenant('a', 'token-a', GROUP_A, '@channel_a', db_name=str(tmp_path / 'a.db')),
+        bot.Tenant('b', 'token-b', GROUP_B, '@channel_b', db_name=str(tmp_path / 'b.db'), digest_mode=True),
+    ]
+    yield tenants
+    for tenant in tenants:
+        tenant.db.conn.close()
+
+
+def test_tenants_do_not_touch_each_others_data(tenants):
+    bots = {tenant.name: FakeBot() for tenant in tenants}
+
+    async def handle_updates(tenant, user_ids):
+        fake_bot = bots[tenant.name]
+        context = SimpleNamespace(bot=fake_bot, bot_data={'tenant': tenant})
+        for user_id in user_ids:
+            # Как в обработчике группы -2: привязываем обновление к сообществу
+            await bot.bind_tenant(SimpleNamespace(), context)
+            await submit_post(fake_bot, user_id)
+            # Передаем управление другому сообществу посреди обработки
+            await asyncio.sleep(0)
+        await bot.outbox_worker_job(context)
+        for post_id in range(1, len(user_ids) + 1):
+            await bot.bind_tenant(SimpleNamespace(), context)
+            await moderate_post(fake_bot, post_id, 'reject')
+            await asyncio.sleep(0)
+        await bot.outbox_worker_job(context)
+        await bot.flush_digest_job(context)
+
+    async def scenario():
+        await asyncio.gather(
+            handle_updates(tenants[0], [1, 2, 3]),
+            handle_updates(tenants[1], [10, 20]),
+        )
+
+    asyncio.run(scenario())
+
+    user_ids = [
+        [row[0] for row in tenant.db.conn.execute('SELECT user_id FROM posts ORDER BY post_id')]
+        for tenant in tenants
+    ]
+    assert user_ids == [[1, 2, 3], [10, 20]]
+    assert all(tenant.db.get_post(1)['status'] == 'rejected' for tenant in tenants)
+
+    # Каждый бот пишет только в свою группу и своим пользователям
+    assert {call[1] for call in bots['a'].calls} == {GROUP_A, 1, 2, 3}
+    assert {call[1] for call in bots['b'].calls} == {GROUP_B, 10, 20}
+    # Дайджест включен только у второго сообщества
+    notes_a = [call[2] for call in bots['a'].calls if call[1] in (GROUP_A, GROUP_B) and '❌' in call[2]]
+    notes_b = [call[2] for call in bots['b'].calls if call[1] in (GROUP_A, GROUP_B) and '❌' in call[2]]
+    assert len(notes_a) == 3
+    assert len(notes_b) == 1 and notes_b[0].count('❌') == 2
+
+
+def write_config(tmp_path, monkeypatch, configs):
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps(configs), encoding='utf-8')
+    monkeypatch.setattr(bot, 'TENANTS_FILE', str(path))
+
+
+def tenant_config(name, **extra):
+    return {'name': name, 'bot_token': f"token-{name}", 'moderator_group_id': -100, 'channel_id': '@channel', **extra}
+
+
+def test_load_tenants_reads_per_tenant_digest_settings(tmp_path, monkeypatch):
+    write_config(tmp_path, monkeypatch, [
+        tenant_config('a', db_name=str(tmp_path / 'a.db')),
+        tenant_config('b', db_name=str(tmp_path / 'b.db'), digest_mode=True, digest_interval=300, digest_thread_id=42),
+    ])
+
+    first, second = bot.load_tenants()
+    try:
+        assert (first.digest_mode, first.digest_interval, first.digest.thread_id) == (
+            bot.DIGEST_MODE, bot.DIGEST_INTERVAL, bot.DIGEST_THREAD_ID
+        )
+        assert (second.digest_mode, second.digest_interval, second.digest.thread_id) == (True, 300, 42)
+    finally:
+        first.db.conn.close()
+        second.db.conn.close()
+
+
+@pytest.mark.parametrize('configs', [
+    [tenant_config('a', db_name='shared.db'), tenant_config('b', db_name='shared.db')],
+    # Имя по умолчанию строится из name
+    [tenant_config('a'), tenant_config('a')],
+    [tenant_config('a'), tenant_config('b', db_name='bot_database_a.db')],
+])
+def test_load_tenants_rejects_shared_database(tmp_path, monkeypatch, configs):
+    write_config(tmp_path, monkeypatch, configs)
+    monkeypatch.chdir(tmp_path)
+
+    with pytest.raises(ValueError, match='own database'):
+        bot.load_tenants()
+
+    # Проверка выполняется до открытия баз
+    assert list(tmp_path.glob('*.db')) == []